@@ -2,6 +2,7 @@
 
 from home.src.es.connect import ElasticWrap
 from home.src.index.video_streams import DurationConverter
+from home.src.ta.ta_redis import IndexVersion, RedisArchivist
 
 
 class AggBase:
@@ -10,13 +11,26 @@ class AggBase:
     path: str = ""
     data: dict = {}
     name: str = ""
+    cache_ttl: int = 300
 
     def get(self):
-        """make get call"""
+        """get from cache, make get call if index changed or expired"""
+        cache_key = f"agg:{self.name}:{IndexVersion().get()}"
+        cached = RedisArchivist().get_message(cache_key)
+        if "aggregations" in cached:
+            return cached["aggregations"]
+
         response, _ = ElasticWrap(self.path).get(self.data)
         print(f"[agg][{self.name}] took {response.get('took')} ms to process")
+        aggregations = response.get("aggregations")
+        if aggregations:
+            RedisArchivist().set_message(
+                cache_key,
+                {"aggregations": aggregations},
+                expire=self.cache_ttl,
+            )
 
-        return response.get("aggregations")
+        return aggregations
 
     def process(self):
         """implement in subclassess"""
@@ -159,6 +173,7 @@ class DownloadHist(AggBase):
 
     name = "videos_last_week"
     path = "ta_video/_search"
+    cache_ttl = 600
     data = {
         "size": 0,
         "aggs": {
@@ -198,6 +213,7 @@ class BiggestChannel(AggBase):
 
     name = "channel_stats"
     path = "ta_video/_search"
+    cache_ttl = 600
     data = {
         "size": 0,
         "aggs": {
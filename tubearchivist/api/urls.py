@@ -156,4 +156,9 @@ urlpatterns = [
         views.StatBiggestChannel.as_view(),
         name="api-stats-biggestchannels",
     ),
+    path(
+        "stats/es/",
+        views.StatElasticView.as_view(),
+        name="api-stats-es",
+    ),
 ]
@@ -8,13 +8,14 @@ from home.src.download.subscriptions import (
     PlaylistSubscription,
 )
 from home.src.download.yt_dlp_base import CookieHandler
-from home.src.es.connect import ElasticWrap
+from home.src.es.connect import ElasticSession, ElasticWrap
+from home.src.es.metrics import ElasticMetrics
 from home.src.es.snapshot import ElasticSnapshot
 from home.src.frontend.searching import SearchForm
 from home.src.frontend.watched import WatchState
 from home.src.index.channel import YoutubeChannel
 from home.src.index.generic import Pagination
-from home.src.index.playlist import YoutubePlaylist
+from home.src.index.playlist import PlaylistEntries, YoutubePlaylist
 from home.src.index.reindex import ReindexProgress
 from home.src.index.video import SponsorBlock, YoutubeVideo
 from home.src.ta.config import AppConfig, ReleaseVersion
@@ -472,6 +473,10 @@ class PlaylistApiView(ApiBaseView):
         # pylint: disable=unused-argument
         """get request"""
         self.get_document(playlist_id)
+        if self.response["data"]:
+            entries = PlaylistEntries(playlist_id).get()
+            self.response["data"]["playlist_entries"] = entries
+
         return Response(self.response, status=self.status_code)
 
     def delete(self, request, playlist_id):
@@ -1031,3 +1036,25 @@ class StatBiggestChannel(ApiBaseView):
             return Response(message, status=400)
 
         return Response(BiggestChannel().process())
+
+
+class StatElasticView(ApiBaseView):
+    """resolves to /api/stats/es/
+    GET: return latency histograms per endpoint and slow calls
+    DELETE: reset recorded es stats
+    """
+
+    def get(self, request):
+        """handle get request"""
+        # pylint: disable=unused-argument
+        response = ElasticMetrics.get_stats()
+        response.update({"connections": ElasticSession.get_stats()})
+
+        return Response(response)
+
+    def delete(self, request):
+        """handle delete request"""
+        # pylint: disable=unused-argument
+        ElasticMetrics.reset()
+
+        return Response({"success": True})
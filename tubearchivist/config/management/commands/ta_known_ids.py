@@ -0,0 +1,27 @@
+"""rebuild known video ids in redis from elasticsearch"""
+
+from django.core.management.base import BaseCommand
+from home.src.download.queue import PendingIndex
+
+TOPIC = """
+
+#######################
+#  Rebuild Known IDs  #
+#######################
+
+"""
+
+
+class Command(BaseCommand):
+    """command framework"""
+
+    # pylint: disable=no-member
+
+    def handle(self, *args, **options):
+        """run commands"""
+        self.stdout.write(TOPIC)
+        counts = PendingIndex.rebuild_known()
+        for state, count in counts.items():
+            self.stdout.write(f"    {state}: {count} video ids")
+
+        self.stdout.write(self.style.SUCCESS("    ✓ known video ids rebuilt"))
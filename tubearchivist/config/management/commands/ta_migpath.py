@@ -1,11 +1,11 @@
 """filepath migration from v0.3.6 to v0.3.7"""
 
-import json
 import os
 import shutil
 
 from django.core.management.base import BaseCommand
-from home.src.es.connect import ElasticWrap, IndexPaginate
+from home.src.es.bulk import BulkWriter
+from home.src.es.connect import IndexPaginate
 from home.src.ta.config import AppConfig
 from home.src.ta.helper import ignore_filelist
 
@@ -60,7 +60,7 @@ class FolderMigration:
     def __init__(self):
         self.config = AppConfig().config
         self.videos = self.config["application"]["videos"]
-        self.bulk_list = []
+        self.bulk = BulkWriter(max_docs=1000, refresh=True)
 
     def get_to_migrate(self):
         """get videos to migrate"""
@@ -112,11 +112,9 @@ class FolderMigration:
             if all_subtitles:
                 source["doc"].update({"subtitles": all_subtitles})
 
-            self.bulk_list.append(json.dumps(action))
-            self.bulk_list.append(json.dumps(source))
+            self.bulk.add(action, source)
             if idx % 1000 == 0:
                 print(f"processing migration [{idx}/{total}]")
-                self.send_bulk()
 
     def _move_video_file(self, video):
         """move video file to new location"""
@@ -156,19 +154,12 @@ class FolderMigration:
         return all_subtitles
 
     def send_bulk(self):
-        """send bulk request to update index with new urls"""
-        if not self.bulk_list:
+        """send remaining bulk updates to index with new urls"""
+        if not self.bulk.sent and not self.bulk.buffer:
             print("nothing to update")
             return
 
-        self.bulk_list.append("\n")
-        path = "_bulk?refresh=true"
-        data = "\n".join(self.bulk_list)
-        response, status = ElasticWrap(path).post(data=data, ndjson=True)
-        if not status == 200:
-            print(response)
-
-        self.bulk_list = []
+        self.bulk.close()
 
     def delete_old(self):
         """delete old empty folders"""
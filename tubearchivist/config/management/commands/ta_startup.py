@@ -8,9 +8,12 @@ import os
 from time import sleep
 
 from django.core.management.base import BaseCommand, CommandError
+from home.src.download.queue import PendingIndex
+from home.src.download.yt_dlp_base import InfoCache
 from home.src.es.connect import ElasticWrap, IndexPaginate
 from home.src.es.index_setup import ElasitIndexWrap
 from home.src.es.snapshot import ElasticSnapshot
+from home.src.index.playlist import PlaylistEntries, YoutubePlaylist
 from home.src.index.video_streams import MediaStreamExtractor
 from home.src.ta.config import AppConfig, ReleaseVersion
 from home.src.ta.helper import clear_dl_cache
@@ -44,6 +47,9 @@ class Command(BaseCommand):
         self._mig_snapshot_check()
         self._mig_set_streams()
         self._mig_set_autostart()
+        self._mig_playlist_entries()
+        self._mig_playlist_position()
+        self._rebuild_known_ids()
 
     def _sync_redis_state(self):
         """make sure redis gets new config.json values"""
@@ -64,6 +70,7 @@ class Command(BaseCommand):
             "channels",
             "download",
             "import",
+            "info",
             "playlists",
             "videos",
         ]
@@ -118,7 +125,7 @@ class Command(BaseCommand):
         """clear leftover files from dl cache"""
         self.stdout.write("[5] clear leftover files from dl cache")
         config = AppConfig().config
-        leftover_files = clear_dl_cache(config)
+        leftover_files = clear_dl_cache(config) + InfoCache.clean(config)
         if leftover_files:
             self.stdout.write(
                 self.style.SUCCESS(f"    ✓ cleared {leftover_files} files")
@@ -157,13 +164,16 @@ class Command(BaseCommand):
             },
             "_source": ["media_url", "youtube_id"],
         }
-        all_missing = IndexPaginate("ta_video", data).get_results()
-        if not all_missing:
+        response, _ = ElasticWrap("ta_video/_count").get(
+            data={"query": data["query"]}
+        )
+        total = response.get("count")
+        if not total:
             self.stdout.write("    no videos need updating")
             return
 
-        total = len(all_missing)
-        for idx, missing in enumerate(all_missing):
+        paginate = IndexPaginate("ta_video", data)
+        for idx, missing in enumerate(paginate.iter_hits()):
             media_url = missing["media_url"]
             youtube_id = missing["youtube_id"]
             media_path = os.path.join(videos, media_url)
@@ -219,3 +229,93 @@ class Command(BaseCommand):
         self.stdout.write(response)
         sleep(60)
         raise CommandError(message)
+
+    def _mig_playlist_entries(self):
+        """migration: move playlist_entries to ta_playlist_entry index"""
+        self.stdout.write("[MIGRATION] move playlist entries to own index")
+        query = {"exists": {"field": "playlist_entries"}}
+        data = {
+            "query": query,
+            "_source": ["playlist_id", "playlist_entries"],
+        }
+        paginate = IndexPaginate("ta_playlist", data, size=50)
+        moved = 0
+        for playlist in paginate.iter_hits():
+            entries = PlaylistEntries(playlist["playlist_id"])
+            entries.write(playlist["playlist_entries"])
+            moved += 1
+
+        if not moved:
+            self.stdout.write("    no playlists need updating")
+            return
+
+        data = {
+            "query": query,
+            "script": {"source": "ctx._source.remove('playlist_entries')"},
+        }
+        path = "ta_playlist/_update_by_query?refresh=true"
+        response, status_code = ElasticWrap(path).post(data=data)
+        if status_code == 200:
+            self.stdout.write(
+                self.style.SUCCESS(f"    ✓ moved entries of {moved} playlists")
+            )
+            return
+
+        message = "    🗙 ta_playlist entries cleanup failed"
+        self.stdout.write(self.style.ERROR(message))
+        self.stdout.write(response)
+        sleep(60)
+        raise CommandError(message)
+
+    def _mig_playlist_position(self):
+        """migration: set playlist_position of videos in playlists,
+        run once, videos still without position can't be fixed"""
+        self.stdout.write("[MIGRATION] set playlist position of videos")
+        redis_con = RedisArchivist()
+        done_key = "migration:playlist_position"
+        if redis_con.get_message(done_key)["status"]:
+            self.stdout.write("    playlist position already migrated")
+            return
+
+        query = {
+            "bool": {
+                "must": [{"exists": {"field": "playlist"}}],
+                "must_not": [
+                    {
+                        "nested": {
+                            "path": "playlist_position",
+                            "query": {"match_all": {}},
+                        }
+                    }
+                ],
+            }
+        }
+        data = {"query": query, "_source": ["playlist"]}
+        playlist_ids = set()
+        for video in IndexPaginate("ta_video", data).iter_hits():
+            playlist_ids.update(video["playlist"])
+
+        for playlist_id in playlist_ids:
+            playlist = YoutubePlaylist(playlist_id)
+            downloaded = playlist.entries.get(downloaded_only=True)
+            youtube_ids = [i["youtube_id"] for i in downloaded]
+            playlist.add_vids_to_playlist(youtube_ids)
+
+        redis_con.set_message(done_key, {"status": True}, save=True)
+        if not playlist_ids:
+            self.stdout.write("    no videos need updating")
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"    ✓ set position in {len(playlist_ids)} playlists"
+            )
+        )
+
+    def _rebuild_known_ids(self):
+        """sync known video ids in redis with index"""
+        self.stdout.write("[7] rebuild known video ids")
+        counts = PendingIndex.rebuild_known()
+        self.stdout.write(
+            self.style.SUCCESS(f"    ✓ known video ids rebuilt: {counts}")
+        )
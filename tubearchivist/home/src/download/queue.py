@@ -4,8 +4,11 @@ Functionality:
 - linked with ta_dowload index
 """
 
-import json
+import contextvars
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+from itertools import islice
 
 from home.src.download.subscriptions import (
     ChannelSubscription,
@@ -13,21 +16,26 @@ from home.src.download.subscriptions import (
 )
 from home.src.download.thumbnails import ThumbManager
 from home.src.download.yt_dlp_base import YtWrap
-from home.src.es.connect import ElasticWrap, IndexPaginate
+from home.src.es.bulk import BulkWriter
+from home.src.es.connect import ElasticWrap, IndexPaginate, RefreshPolicy
 from home.src.index.playlist import YoutubePlaylist
 from home.src.index.video_constants import VideoTypeEnum
 from home.src.index.video_streams import DurationConverter
 from home.src.ta.config import AppConfig
 from home.src.ta.helper import is_shorts
+from home.src.ta.rate_limit import BandwidthLimiter, RateLimiter
+from home.src.ta.ta_redis import KnownIds
 
 
 class PendingIndex:
     """base class holding all export methods"""
 
+    _rebuild_lock = threading.Lock()
+
     def __init__(self):
         self.all_pending = False
         self.all_ignored = False
-        self.all_videos = False
+        self.all_video_ids = False
         self.all_channels = False
         self.channel_overwrites = False
         self.video_overwrites = False
@@ -43,24 +51,62 @@ class PendingIndex:
 
         self.all_pending = []
         self.all_ignored = []
-        self.to_skip = []
+        self.to_skip = set()
 
         for result in all_results:
-            self.to_skip.append(result["youtube_id"])
+            self.to_skip.add(result["youtube_id"])
             if result["status"] == "pending":
                 self.all_pending.append(result)
             elif result["status"] == "ignore":
                 self.all_ignored.append(result)
 
     def get_indexed(self):
-        """get a list of all videos indexed"""
-        data = {
-            "query": {"match_all": {}},
-            "sort": [{"published": {"order": "desc"}}],
-        }
-        self.all_videos = IndexPaginate("ta_video", data).get_results()
-        for video in self.all_videos:
-            self.to_skip.append(video["youtube_id"])
+        """get a set of all video ids indexed"""
+        self.all_video_ids = self.get_indexed_ids()
+        self.to_skip.update(self.all_video_ids)
+
+    @classmethod
+    def get_indexed_ids(cls):
+        """get set of all video ids indexed, from redis if available"""
+        known = KnownIds()
+        if known.is_ready():
+            return known.members("indexed")
+
+        return cls._fetch_indexed_ids()
+
+    @staticmethod
+    def _fetch_indexed_ids():
+        """get set of all video ids indexed from es, fetch ids only"""
+        data = {"query": {"match_all": {}}, "_source": False}
+        paginate = IndexPaginate("ta_video", data, size=5000, keep_source=True)
+        return {hit["_id"] for hit in paginate.iter_hits()}
+
+    @classmethod
+    def rebuild_known(cls):
+        """rebuild known video ids in redis from es"""
+        all_ids = {"indexed": cls._fetch_indexed_ids()}
+        data = {"query": {"match_all": {}}, "_source": ["status"]}
+        paginate = IndexPaginate(
+            "ta_download", data, size=5000, keep_source=True
+        )
+        for hit in paginate.iter_hits():
+            status = hit["_source"]["status"]
+            all_ids.setdefault(status, set()).add(hit["_id"])
+
+        KnownIds().replace(all_ids)
+        return {key: len(value) for key, value in all_ids.items()}
+
+    @classmethod
+    def find_unknown(cls, video_ids):
+        """filter video ids not indexed, pending or ignored"""
+        known = KnownIds()
+        if not known.is_ready():
+            with cls._rebuild_lock:
+                # another scan thread may have rebuilt while waiting
+                if not known.is_ready():
+                    cls.rebuild_known()
+
+        return known.find_unknown(list(video_ids))
 
     def get_channels(self):
         """get a list of all channels indexed"""
@@ -85,7 +131,7 @@ class PendingIndex:
     def _map_overwrites(self):
         """map video ids to channel ids overwrites"""
         self.video_overwrites = {}
-        for video in self.all_pending:
+        for video in self.all_pending or []:
             video_id = video["youtube_id"]
             channel_id = video["channel_id"]
             overwrites = self.channel_overwrites.get(channel_id, False)
@@ -104,12 +150,16 @@ class PendingInteract:
         """delete single item from pending"""
         path = f"ta_download/_doc/{self.youtube_id}"
         _, _ = ElasticWrap(path).delete(refresh=True)
+        KnownIds().remove([self.youtube_id], states=["pending", "ignore"])
+        RefreshPolicy.bump_version()
 
     def delete_by_status(self):
         """delete all matching item by status"""
         data = {"query": {"term": {"status": {"value": self.status}}}}
         path = "ta_download/_delete_by_query"
-        _, _ = ElasticWrap(path).post(data=data)
+        _, _ = ElasticWrap(path).post(data=data, refresh=True)
+        KnownIds().clear_state(self.status)
+        RefreshPolicy.bump_version()
 
     def update_status(self):
         """update status of pending item"""
@@ -124,8 +174,10 @@ class PendingInteract:
         else:
             data = {"doc": {"status": self.status}}
 
-        path = f"ta_download/_update/{self.youtube_id}/?refresh=true"
-        _, _ = ElasticWrap(path).post(data=data)
+        path = f"ta_download/_update/{self.youtube_id}"
+        _, _ = ElasticWrap(path).post(data=data, refresh=True)
+        KnownIds().move(self.youtube_id, data["doc"]["status"])
+        RefreshPolicy.bump_version()
 
     def get_item(self):
         """return pending item dict"""
@@ -157,6 +209,7 @@ class PendingInteract:
 class PendingList(PendingIndex):
     """manage the pending videos list"""
 
+    EXTRACT_WORKERS = 4
     yt_obs = {
         "noplaylist": True,
         "writethumbnail": True,
@@ -175,8 +228,7 @@ class PendingList(PendingIndex):
     def parse_url_list(self):
         """extract youtube ids from list"""
         self.missing_videos = []
-        self.get_download()
-        self.get_indexed()
+        self.to_skip = set()
         total = len(self.youtube_ids)
         for idx, entry in enumerate(self.youtube_ids):
             self._process_entry(entry)
@@ -188,6 +240,8 @@ class PendingList(PendingIndex):
                 progress=(idx + 1) / total,
             )
 
+        self._filter_known()
+
     def _process_entry(self, entry):
         """process single entry from url list"""
         vid_type = self._get_vid_type(entry)
@@ -211,11 +265,21 @@ class PendingList(PendingIndex):
         return VideoTypeEnum(vid_type_str)
 
     def _add_video(self, url, vid_type):
-        """add video to list"""
-        if url not in self.missing_videos and url not in self.to_skip:
+        """add video to list, skip duplicates within same request"""
+        if url not in self.to_skip:
             self.missing_videos.append((url, vid_type))
-        else:
-            print(f"{url}: skipped adding already indexed video to download.")
+            self.to_skip.add(url)
+
+    def _filter_known(self):
+        """remove videos already indexed, pending or ignored"""
+        unknown = set(self.find_unknown(i[0] for i in self.missing_videos))
+        for url, _ in self.missing_videos:
+            if url not in unknown:
+                print(f"{url}: skipped adding already indexed video.")
+
+        self.missing_videos = [
+            i for i in self.missing_videos if i[0] in unknown
+        ]
 
     def _parse_channel(self, url, vid_type):
         """add all videos of channel to list"""
@@ -229,7 +293,7 @@ class PendingList(PendingIndex):
         """add all videos of playlist to list"""
         playlist = YoutubePlaylist(url)
         playlist.build_json()
-        video_results = playlist.json_data.get("playlist_entries")
+        video_results = playlist.get_members()
         youtube_ids = [i["youtube_id"] for i in video_results]
         for video_id in youtube_ids:
             # match vid_type later
@@ -238,48 +302,80 @@ class PendingList(PendingIndex):
     def add_to_pending(self, status="pending", auto_start=False):
         """add missing videos to pending list"""
         self.get_channels()
-        bulk_list = []
-
         total = len(self.missing_videos)
-        for idx, (youtube_id, vid_type) in enumerate(self.missing_videos):
-            if self.task and self.task.is_stopped():
-                break
-
-            print(f"{youtube_id}: [{idx + 1}/{total}]: add to queue")
-            self._notify_add(idx, total)
-            video_details = self.get_youtube_details(youtube_id, vid_type)
-            if not video_details:
-                continue
-
-            video_details.update(
-                {
-                    "status": status,
-                    "auto_start": auto_start,
-                }
-            )
-
-            action = {"create": {"_id": youtube_id, "_index": "ta_download"}}
-            bulk_list.append(json.dumps(action))
-            bulk_list.append(json.dumps(video_details))
-
-            url = video_details["vid_thumb_url"]
-            ThumbManager(youtube_id).download_video_thumb(url)
+        added = []
+        with BulkWriter(max_docs=10, refresh=True) as bulk:
+            for idx, video_details in enumerate(self._extract_missing()):
+                self._notify_add(idx, total)
+                if not video_details:
+                    continue
+
+                video_details.update(
+                    {
+                        "status": status,
+                        "auto_start": auto_start,
+                    }
+                )
+                self._ingest_bulk(bulk, video_details)
+                added.append(video_details["youtube_id"])
+
+        KnownIds().add(status, added)
+        RefreshPolicy.bump_version()
+
+    def _extract_missing(self):
+        """extract missing videos in thread pool, yield as completed"""
+        # sleep_interval between calls to youtube across all workers
+        sleep_interval = self.config["downloads"]["sleep_interval"]
+        limiter = RateLimiter(1, sleep_interval)
+        bandwidth = BandwidthLimiter(self.config)
+        to_extract = iter(self.missing_videos)
+        with ThreadPoolExecutor(
+            max_workers=self.EXTRACT_WORKERS, thread_name_prefix="extract"
+        ) as executor:
+            running = set()
+            while True:
+                if not (self.task and self.task.is_stopped()):
+                    to_add = self.EXTRACT_WORKERS * 2 - len(running)
+                    for youtube_id, vid_type in islice(to_extract, to_add):
+                        # each thread needs its own context for RefreshPolicy
+                        context = contextvars.copy_context()
+                        future = executor.submit(
+                            context.run,
+                            self._extract_single,
+                            youtube_id,
+                            vid_type,
+                            limiter,
+                            bandwidth,
+                        )
+                        running.add(future)
+
+                if not running:
+                    break
+
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    def _extract_single(self, youtube_id, vid_type, limiter, bandwidth):
+        """get details and thumbnail of single video, run in worker"""
+        limiter.wait()
+        print(f"{youtube_id}: add to queue")
+        video_details = self.get_youtube_details(youtube_id, vid_type)
+        if not video_details:
+            return False
 
-            if len(bulk_list) >= 20:
-                self._ingest_bulk(bulk_list)
-                bulk_list = []
+        url = video_details["vid_thumb_url"]
+        thumb = ThumbManager(youtube_id, limiter=bandwidth)
+        thumb.download_video_thumb(url)
 
-        self._ingest_bulk(bulk_list)
+        return video_details
 
-    def _ingest_bulk(self, bulk_list):
-        """add items to queue in bulk"""
-        if not bulk_list:
-            return
-
-        # add last newline
-        bulk_list.append("\n")
-        query_str = "\n".join(bulk_list)
-        _, _ = ElasticWrap("_bulk?refresh=true").post(query_str, ndjson=True)
+    @staticmethod
+    def _ingest_bulk(bulk, video_details):
+        """add item to queue through bulk writer"""
+        youtube_id = video_details["youtube_id"]
+        action = {"create": {"_id": youtube_id, "_index": "ta_download"}}
+        bulk.add(action, video_details)
 
     def _notify_add(self, idx, total):
         """send notification for adding videos to download queue"""
@@ -294,9 +390,10 @@ class PendingList(PendingIndex):
             progress=(idx + 1) / total,
         )
 
-    def get_youtube_details(self, youtube_id, vid_type=VideoTypeEnum.VIDEOS):
+    def get_youtube_details(self, youtube_id, vid_type=VideoTypeEnum.UNKNOWN):
         """get details from youtubedl for single pending video"""
-        vid = YtWrap(self.yt_obs, self.config).extract(youtube_id)
+        vid_type = VideoTypeEnum(vid_type)
+        vid = YtWrap(self.yt_obs, self.config).extract(youtube_id, cache=True)
         if not vid:
             return False
 
@@ -311,7 +408,8 @@ class PendingList(PendingIndex):
 
         if vid["live_status"] == "was_live":
             vid_type = VideoTypeEnum.STREAMS
-        else:
+        elif vid_type == VideoTypeEnum.UNKNOWN:
+            # trust vid_type from channel tab, detect otherwise
             if self._check_shorts(vid):
                 vid_type = VideoTypeEnum.SHORTS
             else:
@@ -2,34 +2,194 @@
 Functionality:
 - handle channel subscriptions
 - handle playlist subscriptions
+- scan subscriptions concurrently
+- scan channels incrementally
+- schedule channel scans by upload cadence
 """
 
+import contextvars
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import requests
+from celery.schedules import crontab
 from home.src.download import queue  # partial import
 from home.src.download.thumbnails import ThumbManager
 from home.src.download.yt_dlp_base import YtWrap
+from home.src.es.bulk import BulkWriter
 from home.src.es.connect import IndexPaginate
 from home.src.index.channel import YoutubeChannel
 from home.src.index.playlist import YoutubePlaylist
 from home.src.index.video_constants import VideoTypeEnum
 from home.src.ta.config import AppConfig
+from home.src.ta.helper import requests_headers
+from home.src.ta.rate_limit import RateLimiter
+from home.src.ta.ta_redis import ScanMarkers
 from home.src.ta.urlparser import Parser
 
 
+class ScanPool:
+    """scan items concurrently, merge results in order of items"""
+
+    WORKERS = 4
+
+    def __init__(self, task=False, label="Scanning"):
+        self.task = task
+        self.label = label
+        self.is_stopped = False
+        self.total = 0
+
+    @classmethod
+    def get_limiter(cls, config):
+        """shared limiter, sleep_interval between calls across all workers"""
+        return RateLimiter(1, config["downloads"]["sleep_interval"])
+
+    def run(self, items, scan_func):
+        """run scan_func for every item, return flat list of results"""
+        self.total = len(items)
+        results = [None] * self.total
+        to_submit = enumerate(items)
+        with ThreadPoolExecutor(
+            max_workers=self.WORKERS, thread_name_prefix="scan"
+        ) as executor:
+            running = {}
+            while True:
+                if not self.is_stopped:
+                    self._submit(executor, running, to_submit, scan_func)
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+                self._notify(self.total - results.count(None))
+
+        return [i for result in results if result for i in result]
+
+    def _submit(self, executor, running, to_submit, scan_func):
+        """keep twice the workers of items in flight"""
+        for idx, item in to_submit:
+            # each thread needs its own context for RefreshPolicy
+            context = contextvars.copy_context()
+            running[executor.submit(context.run, scan_func, item)] = idx
+            if len(running) >= self.WORKERS * 2:
+                break
+
+    def _notify(self, processed):
+        """send progress, check for stop signal"""
+        if not self.task or self.is_stopped:
+            return
+
+        if self.task.is_stopped():
+            self.task.send_progress(["Received Stop signal."])
+            self.is_stopped = True
+            return
+
+        self.task.send_progress(
+            message_lines=[f"{self.label} {processed}/{self.total}"],
+            progress=processed / self.total,
+        )
+
+
+class ScanSchedule:
+    """adapt rescan interval of channels to their upload cadence"""
+
+    KEEP = 15
+
+    def __init__(self, config):
+        sub_config = config["subscriptions"]
+        self.floor = (sub_config.get("scan_floor") or 0) * 60 * 60
+        self.ceiling = (sub_config.get("scan_ceiling") or 0) * 60 * 60
+
+    def get_due(self, uploads, now):
+        """get timestamp of next scan, half the expected upload gap"""
+        interval = 0
+        if uploads:
+            gaps = [i - j for i, j in zip(uploads, uploads[1:])]
+            cadence = sum(gaps) / len(gaps) if gaps else 0
+            interval = max(cadence, now - uploads[0]) / 2
+
+        interval = max(interval, self.floor)
+        if self.ceiling:
+            interval = min(interval, self.ceiling)
+
+        return int(now + interval)
+
+    @staticmethod
+    def get_next_run(config):
+        """timestamp of next scheduled rescan, now if not scheduled,
+        channels due before that are scanned in current run"""
+        schedule_conf = config["scheduler"].get("update_subscribed")
+        if not schedule_conf:
+            return int(datetime.now().timestamp())
+
+        schedule = crontab(
+            minute=schedule_conf["minute"],
+            hour=schedule_conf["hour"],
+            day_of_week=schedule_conf["day_of_week"],
+        )
+        now = schedule.now()
+        next_run = now + schedule.remaining_estimate(now)
+
+        return int(next_run.timestamp())
+
+    def update(self, channels, uploads):
+        """store upload timestamps and next due of scanned channels"""
+        now = int(datetime.now().timestamp())
+        with BulkWriter(refresh=True) as bulk:
+            for channel in channels:
+                channel_id = channel["channel_id"]
+                if channel_id not in uploads:
+                    # not scanned
+                    continue
+
+                channel_uploads = uploads[channel_id]
+                if channel_uploads is None:
+                    # feed failed, keep last known
+                    channel_uploads = channel.get("channel_uploads") or []
+
+                channel_uploads = sorted(channel_uploads, reverse=True)
+                channel_uploads = channel_uploads[: self.KEEP]
+                action = {
+                    "update": {"_index": "ta_channel", "_id": channel_id}
+                }
+                source = {
+                    "doc": {
+                        "channel_uploads": channel_uploads,
+                        "channel_scan_due": self.get_due(channel_uploads, now),
+                    }
+                }
+                bulk.add(action, source)
+
+
 class ChannelSubscription:
     """manage the list of channels subscribed"""
 
     def __init__(self, task=False):
         self.config = AppConfig().config
         self.task = task
+        self.limiter = False
+        self.markers = {}
+        self.uploads = {}
 
     @staticmethod
-    def get_channels(subscribed_only=True):
-        """get a list of all channels subscribed to"""
+    def get_channels(subscribed_only=True, due_before=False):
+        """get a list of all channels subscribed to,
+        due_before timestamp to get channels due for scan"""
         data = {
             "sort": [{"channel_name.keyword": {"order": "asc"}}],
         }
-        if subscribed_only:
-            data["query"] = {"term": {"channel_subscribed": {"value": True}}}
+        subscribed = {"term": {"channel_subscribed": {"value": True}}}
+        if due_before:
+            not_due = {"range": {"channel_scan_due": {"gt": due_before}}}
+            data["query"] = {
+                "bool": {"must": [subscribed], "must_not": [not_due]}
+            }
+        elif subscribed_only:
+            data["query"] = subscribed
         else:
             data["query"] = {"match_all": {}}
 
@@ -38,10 +198,17 @@ class ChannelSubscription:
         return all_channels
 
     def get_last_youtube_videos(
-        self, channel_id, limit=True, query_filter=VideoTypeEnum.UNKNOWN
+        self,
+        channel_id,
+        limit=True,
+        query_filter=VideoTypeEnum.UNKNOWN,
+        incremental=False,
     ):
-        """get a list of last videos from channel"""
+        """get a list of last videos from channel,
+        incremental to stop at videos seen before"""
         queries = self._build_queries(query_filter, limit)
+        if incremental:
+            return self._get_new_videos(channel_id, queries)
 
         last_videos = []
 
@@ -54,6 +221,9 @@ class ChannelSubscription:
                 obs["playlistend"] = limit_amount
 
             vid_type = vid_type_enum.value
+            if self.limiter:
+                self.limiter.wait()
+
             channel = YtWrap(obs, self.config).extract(
                 f"https://www.youtube.com/channel/{channel_id}/{vid_type}"
             )
@@ -65,6 +235,135 @@ class ChannelSubscription:
 
         return last_videos
 
+    def _get_new_videos(self, channel_id, queries):
+        """get videos newer than last scan, skip if feed is unchanged"""
+        markers = ScanMarkers().get(channel_id)
+        feed = self._probe_feed(channel_id)
+        self.uploads[channel_id] = None if feed is False else feed["uploads"]
+        newest_feed = feed and feed["newest"]
+        is_complete = all(i[0].value in markers for i in queries)
+        is_unchanged = newest_feed and newest_feed == markers.get("feed")
+        if is_complete and is_unchanged:
+            print(f"{channel_id}: no new uploads since last scan")
+            return []
+
+        candidates = {}
+        new_videos = []
+        for vid_type_enum, limit_amount in queries:
+            vid_type = vid_type_enum.value
+            known_id = markers.get(vid_type)
+            if self.limiter:
+                self.limiter.wait()
+
+            response = YtWrap({}, self.config).extract_until(
+                f"https://www.youtube.com/channel/{channel_id}/{vid_type}",
+                is_known=lambda i, known=known_id: self._is_known(i, known),
+                limit=limit_amount,
+            )
+            if response is False:
+                continue
+
+            new_videos.extend(
+                [
+                    (i["id"], i.get("title"), vid_type)
+                    for i in response["entries"]
+                ]
+            )
+            # newest first, marker is resolved after adding to pending
+            tab_ids = [i["id"] for i in response["entries"]]
+            if response["known"] or not tab_ids:
+                tab_ids.append(response["known"])
+
+            candidates[vid_type] = tab_ids
+
+        if newest_feed and len(candidates) == len(queries):
+            # only skip next time if all tabs are up to date
+            candidates["feed"] = [newest_feed]
+
+        self.markers[channel_id] = candidates
+
+        return new_videos
+
+    @staticmethod
+    def save_markers(candidates):
+        """store newest indexed or pending id per tab as marker,
+        call after missing videos are added to pending"""
+        if not candidates:
+            return
+
+        all_ids = set()
+        for channel_candidates in candidates.values():
+            for video_ids in channel_candidates.values():
+                all_ids.update(i for i in video_ids if i)
+
+        unknown = set(queue.PendingIndex.find_unknown(all_ids))
+        all_markers = {}
+        for channel_id, channel_candidates in candidates.items():
+            markers = {}
+            is_complete = True
+            for vid_type, video_ids in channel_candidates.items():
+                if vid_type == "feed":
+                    continue
+
+                known = [i for i in video_ids if i not in unknown]
+                if not known or known[0] != video_ids[0]:
+                    is_complete = False
+                if known:
+                    markers[vid_type] = known[0]
+
+            if is_complete and "feed" in channel_candidates:
+                markers["feed"] = channel_candidates["feed"][0]
+
+            all_markers[channel_id] = markers
+
+        ScanMarkers().set_many(all_markers)
+
+    @staticmethod
+    def _is_known(video_id, known_id):
+        """check if video is last seen or already known to archive"""
+        if video_id == known_id:
+            return True
+
+        return not queue.PendingIndex.find_unknown([video_id])
+
+    def _probe_feed(self, channel_id):
+        """get newest id and upload timestamps from rss feed,
+        False on error"""
+        url = "https://www.youtube.com/feeds/videos.xml"
+        if self.limiter:
+            self.limiter.wait()
+
+        try:
+            response = requests.get(
+                url,
+                params={"channel_id": channel_id},
+                headers=requests_headers(),
+                timeout=10,
+            )
+        except requests.exceptions.RequestException:
+            print(f"{channel_id}: failed to probe feed")
+            return False
+
+        if not response.ok:
+            return False
+
+        feed = {"newest": False, "uploads": []}
+        for entry in response.text.split("<entry>")[1:]:
+            video_id = re.search(r"<yt:videoId>([^<]+)</yt:videoId>", entry)
+            published = re.search(r"<published>([^<]+)</published>", entry)
+            if not video_id or not published:
+                continue
+
+            try:
+                uploaded = datetime.fromisoformat(published.group(1))
+            except ValueError:
+                continue
+
+            feed["newest"] = feed["newest"] or video_id.group(1)
+            feed["uploads"].append(int(uploaded.timestamp()))
+
+        return feed
+
     def _build_queries(self, query_filter, limit):
         """build query list for vid_type"""
         limit_map = {
@@ -99,43 +398,42 @@ class ChannelSubscription:
 
         return queries
 
-    def find_missing(self):
-        """add missing videos from subscribed channels to pending"""
-        all_channels = self.get_channels()
+    def find_missing(self, due_only=False):
+        """add missing videos from subscribed channels to pending,
+        due_only to skip channels not due by upload cadence"""
+        due_before = False
+        if due_only:
+            due_before = ScanSchedule.get_next_run(self.config)
+
+        all_channels = self.get_channels(due_before=due_before)
         if not all_channels:
             return False
 
-        pending = queue.PendingList()
-        pending.get_download()
-        pending.get_indexed()
-
-        missing_videos = []
-
-        total = len(all_channels)
-        for idx, channel in enumerate(all_channels):
-            channel_id = channel["channel_id"]
-            print(f"{channel_id}: find missing videos.")
-            last_videos = self.get_last_youtube_videos(channel_id)
-
-            if last_videos:
-                for video_id, _, vid_type in last_videos:
-                    if video_id not in pending.to_skip:
-                        missing_videos.append((video_id, vid_type))
+        self.limiter = ScanPool.get_limiter(self.config)
+        pool = ScanPool(task=self.task, label="Scanning Channel")
+        missing_videos = pool.run(all_channels, self._scan_channel)
+        ScanSchedule(self.config).update(all_channels, self.uploads)
 
-            if not self.task:
-                continue
-
-            if self.task:
-                if self.task.is_stopped():
-                    self.task.send_progress(["Received Stop signal."])
-                    break
+        return missing_videos
 
-                self.task.send_progress(
-                    message_lines=[f"Scanning Channel {idx + 1}/{total}"],
-                    progress=(idx + 1) / total,
-                )
+    def _scan_channel(self, channel):
+        """get missing videos of single channel, run in worker"""
+        channel_id = channel["channel_id"]
+        print(f"{channel_id}: find missing videos.")
+        last_videos = self.get_last_youtube_videos(
+            channel_id, incremental=True
+        )
+        if not last_videos:
+            return []
 
-        return missing_videos
+        unknown = set(
+            queue.PendingIndex.find_unknown(i[0] for i in last_videos)
+        )
+        return [
+            (video_id, vid_type)
+            for video_id, _, vid_type in last_videos
+            if video_id in unknown
+        ]
 
     @staticmethod
     def change_subscribe(channel_id, channel_subscribed):
@@ -174,9 +472,7 @@ class PlaylistSubscription:
 
     def process_url_str(self, new_playlists, subscribed=True):
         """process playlist subscribe form url_str"""
-        data = {"query": {"match_all": {}}, "_source": ["youtube_id"]}
-        all_indexed = IndexPaginate("ta_video", data).get_results()
-        all_youtube_ids = [i["youtube_id"] for i in all_indexed]
+        all_youtube_ids = queue.PendingIndex.get_indexed_ids()
 
         for idx, playlist in enumerate(new_playlists):
             playlist_id = playlist["url"]
@@ -218,65 +514,46 @@ class PlaylistSubscription:
         playlist.json_data["playlist_subscribed"] = subscribe_status
         playlist.upload_to_es()
 
-    @staticmethod
-    def get_to_ignore():
-        """get all youtube_ids already downloaded or ignored"""
-        pending = queue.PendingList()
-        pending.get_download()
-        pending.get_indexed()
-
-        return pending.to_skip
-
     def find_missing(self):
         """find videos in subscribed playlists not downloaded yet"""
         all_playlists = [i["playlist_id"] for i in self.get_playlists()]
         if not all_playlists:
             return False
 
-        to_ignore = self.get_to_ignore()
-
-        missing_videos = []
-        total = len(all_playlists)
-        for idx, playlist_id in enumerate(all_playlists):
-            size_limit = self.config["subscriptions"]["channel_size"]
-            playlist = YoutubePlaylist(playlist_id)
-            is_active = playlist.update_playlist()
-            if not is_active:
-                playlist.deactivate()
-                continue
-
-            playlist_entries = playlist.json_data["playlist_entries"]
-            if size_limit:
-                del playlist_entries[size_limit:]
-
-            all_missing = [i for i in playlist_entries if not i["downloaded"]]
-
-            for video in all_missing:
-                youtube_id = video["youtube_id"]
-                if youtube_id not in to_ignore:
-                    missing_videos.append(youtube_id)
-
-            if not self.task:
-                continue
-
-            if self.task:
-                self.task.send_progress(
-                    message_lines=[f"Scanning Playlists {idx + 1}/{total}"],
-                    progress=(idx + 1) / total,
-                )
-                if self.task.is_stopped():
-                    self.task.send_progress(["Received Stop signal."])
-                    break
+        limiter = ScanPool.get_limiter(self.config)
+        pool = ScanPool(task=self.task, label="Scanning Playlists")
+        return pool.run(
+            all_playlists, lambda i: self._scan_playlist(i, limiter)
+        )
 
-        return missing_videos
+    def _scan_playlist(self, playlist_id, limiter):
+        """get missing videos of single playlist, run in worker"""
+        size_limit = self.config["subscriptions"]["channel_size"]
+        playlist = YoutubePlaylist(playlist_id)
+        limiter.wait()
+        is_active = playlist.update_playlist()
+        if not is_active:
+            playlist.deactivate()
+            return []
+
+        playlist_entries = playlist.get_members()
+        if size_limit:
+            playlist_entries = playlist_entries[:size_limit]
+
+        all_missing = [
+            i["youtube_id"] for i in playlist_entries if not i["downloaded"]
+        ]
+        return queue.PendingIndex.find_unknown(all_missing)
 
 
 class SubscriptionScanner:
     """add missing videos to queue"""
 
-    def __init__(self, task=False):
+    def __init__(self, task=False, due_only=False):
         self.task = task
+        self.due_only = due_only
         self.missing_videos = False
+        self.markers = {}
         self.auto_start = AppConfig().config["subscriptions"].get("auto_start")
 
     def scan(self):
@@ -294,7 +571,8 @@ class SubscriptionScanner:
     def scan_channels(self):
         """get missing from channels"""
         channel_handler = ChannelSubscription(task=self.task)
-        missing = channel_handler.find_missing()
+        missing = channel_handler.find_missing(due_only=self.due_only)
+        self.markers = channel_handler.markers
         if not missing:
             return
 
@@ -314,7 +592,7 @@ class SubscriptionScanner:
             self.missing_videos.append(
                 {
                     "type": "video",
-                    "vid_type": VideoTypeEnum.VIDEOS.value,
+                    "vid_type": VideoTypeEnum.UNKNOWN.value,
                     "url": i,
                 }
             )
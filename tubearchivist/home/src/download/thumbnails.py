@@ -12,6 +12,7 @@ from time import sleep
 import requests
 from home.src.es.connect import ElasticWrap, IndexPaginate
 from home.src.ta.config import AppConfig
+from home.src.ta.rate_limit import BandwidthLimiter
 from mutagen.mp4 import MP4, MP4Cover
 from PIL import Image, ImageFile, ImageFilter, UnidentifiedImageError
 
@@ -27,10 +28,18 @@ class ThumbManagerBase:
     CHANNEL_DIR = os.path.join(CACHE_DIR, "channels")
     PLAYLIST_DIR = os.path.join(CACHE_DIR, "playlists")
 
-    def __init__(self, item_id, item_type, fallback=False):
+    def __init__(self, item_id, item_type, fallback=False, limiter=False):
         self.item_id = item_id
         self.item_type = item_type
         self.fallback = fallback
+        self.limiter = limiter
+
+    def _get_limiter(self):
+        """get limiter shared by batch, build from current config"""
+        if not self.limiter:
+            self.limiter = BandwidthLimiter(AppConfig().config)
+
+        return self.limiter
 
     def download_raw(self, url):
         """download thumbnail for video"""
@@ -39,10 +48,11 @@ class ThumbManagerBase:
 
         for i in range(3):
             try:
-                response = requests.get(url, stream=True, timeout=5)
+                response = requests.get(url, timeout=5)
                 if response.ok:
+                    self._get_limiter().consume(len(response.content))
                     try:
-                        img = Image.open(response.raw)
+                        img = Image.open(BytesIO(response.content))
                         if isinstance(img, Image.Image):
                             return img
                         return self.get_fallback()
@@ -97,8 +107,12 @@ class ThumbManagerBase:
 class ThumbManager(ThumbManagerBase):
     """handle thumbnails related functions"""
 
-    def __init__(self, item_id, item_type="video", fallback=False):
-        super().__init__(item_id, item_type, fallback=fallback)
+    def __init__(
+        self, item_id, item_type="video", fallback=False, limiter=False
+    ):
+        super().__init__(
+            item_id, item_type, fallback=fallback, limiter=limiter
+        )
 
     def download(self, url):
         """download thumbnail"""
@@ -249,6 +263,7 @@ class ValidatorCallback:
     def __init__(self, source, index_name):
         self.source = source
         self.index_name = index_name
+        self.limiter = BandwidthLimiter(AppConfig().config)
 
     def run(self):
         """run the task for page"""
@@ -264,7 +279,9 @@ class ValidatorCallback:
         """check if video thumbnails are correct"""
         for video in self.source:
             url = video["_source"]["vid_thumb_url"]
-            handler = ThumbManager(video["_source"]["youtube_id"])
+            handler = ThumbManager(
+                video["_source"]["youtube_id"], limiter=self.limiter
+            )
             handler.download_video_thumb(url, skip_existing=True)
 
     def _validate_channels(self):
@@ -275,14 +292,18 @@ class ValidatorCallback:
                 channel["_source"]["channel_banner_url"],
                 channel["_source"].get("channel_tvart_url", False),
             )
-            handler = ThumbManager(channel["_source"]["channel_id"])
+            handler = ThumbManager(
+                channel["_source"]["channel_id"], limiter=self.limiter
+            )
             handler.download_channel_art(urls, skip_existing=True)
 
     def _validate_playlists(self):
         """check if all playlist artwork is there"""
         for playlist in self.source:
             url = playlist["_source"]["playlist_thumbnail"]
-            handler = ThumbManager(playlist["_source"]["playlist_id"])
+            handler = ThumbManager(
+                playlist["_source"]["playlist_id"], limiter=self.limiter
+            )
             handler.download_playlist_thumb(url, skip_existing=True)
 
 
@@ -333,7 +354,7 @@ class ThumbValidator:
                 task=self.task,
                 total=total,
             )
-            _ = paginate.get_results()
+            paginate.run_callbacks()
 
     @staticmethod
     def _get_total(index_name):
@@ -366,7 +387,7 @@ class ThumbFilesystem:
             task=self.task,
             total=self._get_total(),
         )
-        _ = paginate.get_results()
+        paginate.run_callbacks()
 
     def _get_total(self):
         """get total documents in index"""
@@ -387,6 +408,7 @@ class EmbedCallback:
     def __init__(self, source, index_name):
         self.source = source
         self.index_name = index_name
+        self.limiter = BandwidthLimiter(AppConfig().config)
 
     def run(self):
         """run embed"""
@@ -2,14 +2,22 @@
 functionality:
 - base class to make all calls to yt-dlp
 - handle yt-dlp errors
+- cache info json of single videos
+- lazy extract new playlist entries
 """
 
+import hashlib
+import json
 import os
 from datetime import datetime
 from http import cookiejar
 from io import StringIO
+from threading import get_ident
+from time import time
+from urllib.parse import parse_qs, urlparse
 
 import yt_dlp
+from home.src.ta.config import AppConfig, ConfigCache
 from home.src.ta.ta_redis import RedisArchivist
 
 
@@ -36,6 +44,7 @@ class YtWrap:
         self.obs.update(self.obs_request)
         if self.config:
             self.add_cookie()
+            self.add_extractor_lang()
 
     def add_cookie(self):
         """add cookie if enabled"""
@@ -43,11 +52,25 @@ class YtWrap:
             cookie_io = CookieHandler(self.config).get()
             self.obs["cookiefile"] = cookie_io
 
+    def add_extractor_lang(self):
+        """add preferred metadata language if set"""
+        langs = self.config["downloads"]["extractor_lang"]
+        if not langs:
+            return
+
+        extractor_args = self.obs.get("extractor_args", {})
+        youtube_args = extractor_args.get("youtube", {}).copy()
+        youtube_args["lang"] = [i.strip() for i in langs.split(",")]
+        self.obs["extractor_args"] = {
+            **extractor_args,
+            "youtube": youtube_args,
+        }
+
     def download(self, url):
-        """make download request"""
+        """make download request, cache info json of download"""
         with yt_dlp.YoutubeDL(self.obs) as ydl:
             try:
-                ydl.download([url])
+                response = ydl.extract_info(url)
             except yt_dlp.utils.DownloadError as err:
                 print(f"{url}: failed to download with message {err}")
                 if "Temporary failure in name resolution" in str(err):
@@ -55,12 +78,21 @@ class YtWrap:
 
                 return False, str(err)
 
+            self._set_cache(url, ydl, response)
+
         return True, True
 
-    def extract(self, url):
-        """make extract request"""
+    def extract(self, url, cache=False):
+        """make extract request, pass cache to use cached info json"""
+        info_cache = self._get_info_cache(url)
+        if cache and info_cache:
+            cached = info_cache.get()
+            if cached:
+                return cached
+
+        ydl = yt_dlp.YoutubeDL(self.obs)
         try:
-            response = yt_dlp.YoutubeDL(self.obs).extract_info(url)
+            response = ydl.extract_info(url)
         except cookiejar.LoadError:
             print("cookie file is invalid")
             return False
@@ -77,8 +109,161 @@ class YtWrap:
 
             return False
 
+        self._set_cache(url, ydl, response)
+
         return response
 
+    def extract_until(self, url, is_known, limit=False):
+        """lazy extract playlist entries, stop at first known id,
+        return newest id, new entries and known id, False on error"""
+        ydl = yt_dlp.YoutubeDL(self.obs)
+        newest = ""
+        known = ""
+        entries = []
+        try:
+            response = ydl.extract_info(url, download=False, process=False)
+            for entry in response.get("entries") or []:
+                newest = newest or entry["id"]
+                if is_known(entry["id"]):
+                    known = entry["id"]
+                    break
+
+                entries.append(entry)
+                if limit and len(entries) >= limit:
+                    break
+
+        except cookiejar.LoadError:
+            print("cookie file is invalid")
+            return False
+        except yt_dlp.utils.YoutubeDLError as err:
+            if "This channel does not have a" in str(err):
+                return {"newest": "", "entries": [], "known": ""}
+
+            print(f"{url}: failed to get info from youtube with message {err}")
+            if "Temporary failure in name resolution" in str(err):
+                raise ConnectionError("lost the internet, abort!") from err
+
+            return False
+
+        return {"newest": newest, "entries": entries, "known": known}
+
+    def _get_info_cache(self, url):
+        """get info cache for url, False if not a single video,
+        comments are extracted once, never cached"""
+        if not self.config or self.obs.get("getcomments"):
+            return False
+
+        video_id = InfoCache.get_video_id(url)
+        if not video_id:
+            return False
+
+        return InfoCache(video_id, self.obs, self.config)
+
+    def _set_cache(self, url, ydl, response):
+        """write single video response to info cache"""
+        if not response or response.get("_type", "video") != "video":
+            return
+
+        if response.get("live_status") in ["is_upcoming", "is_live"]:
+            # still changing, don't reuse
+            return
+
+        info_cache = self._get_info_cache(url)
+        if info_cache:
+            info_cache.set(ydl.sanitize_info(response))
+
+
+class InfoCache:
+    """on disk info json cache, keyed by video id and extractor options"""
+
+    TTL = 60 * 60 * 6
+    KEY_OBS = ["extractor_args"]
+
+    def __init__(self, video_id, obs, config):
+        self.video_id = video_id
+        self.cache_dir = os.path.join(
+            config["application"]["cache_dir"], "info"
+        )
+        self.file_path = os.path.join(self.cache_dir, self._get_name(obs))
+
+    def _get_name(self, obs):
+        """build file name from id and options changing the info json"""
+        key_obs = {i: obs.get(i) for i in self.KEY_OBS}
+        key_str = json.dumps(key_obs, sort_keys=True, default=str)
+        obs_hash = hashlib.sha1(key_str.encode()).hexdigest()[:12]
+
+        return f"{self.video_id}-{obs_hash}.json"
+
+    @staticmethod
+    def get_video_id(url):
+        """get video id from id or watch url, False for anything else"""
+        if len(url) == 11 and "/" not in url:
+            return url
+
+        parsed = urlparse(url)
+        if parsed.path == "/watch":
+            return parse_qs(parsed.query).get("v", [False])[0]
+
+        return False
+
+    def get(self):
+        """get cached info json if not expired"""
+        try:
+            if time() - os.path.getmtime(self.file_path) > self.TTL:
+                return False
+
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+        print(f"{self.video_id}: use cached info json")
+        return cached
+
+    def set(self, info_json):
+        """write info json, replace atomically"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.file_path}.{os.getpid()}-{get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(info_json, f)
+
+        os.replace(tmp_path, self.file_path)
+
+    @staticmethod
+    def delete(video_id, config):
+        """delete all cached info json of video after use"""
+        cache_dir = os.path.join(config["application"]["cache_dir"], "info")
+        if not os.path.exists(cache_dir):
+            return
+
+        for file_name in os.listdir(cache_dir):
+            if not file_name.startswith(f"{video_id}-"):
+                continue
+
+            try:
+                os.remove(os.path.join(cache_dir, file_name))
+            except FileNotFoundError:
+                continue
+
+    @classmethod
+    def clean(cls, config):
+        """delete expired info json files, return count"""
+        cache_dir = os.path.join(config["application"]["cache_dir"], "info")
+        if not os.path.exists(cache_dir):
+            return 0
+
+        deleted = 0
+        for file_name in os.listdir(cache_dir):
+            file_path = os.path.join(cache_dir, file_name)
+            try:
+                if time() - os.path.getmtime(file_path) > cls.TTL:
+                    os.remove(file_path)
+                    deleted += 1
+            except FileNotFoundError:
+                continue
+
+        return deleted
+
 
 class CookieHandler:
     """handle youtube cookie for yt-dlp"""
@@ -115,7 +300,8 @@ class CookieHandler:
         RedisArchivist().set_message("cookie", cookie, save=True)
         path = ".downloads.cookie_import"
         RedisArchivist().set_message("config", True, path=path, save=True)
-        self.config["downloads"]["cookie_import"] = True
+        ConfigCache.invalidate()
+        self.config = AppConfig().config
         print("cookie: activated and stored in Redis")
 
     @staticmethod
@@ -126,6 +312,7 @@ class CookieHandler:
         RedisArchivist().set_message(
             "config", False, path=".downloads.cookie_import"
         )
+        ConfigCache.invalidate()
         print("cookie: revoked")
 
     def validate(self):
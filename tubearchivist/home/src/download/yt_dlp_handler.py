@@ -2,25 +2,32 @@
 functionality:
 - handle yt_dlp
 - build options and post processor
-- download video files
+- download video files with concurrent workers
+- pipeline post download steps
 - move to archive
 """
 
+import contextvars
 import os
-import shutil
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+from queue import Queue
+from uuid import uuid4
 
 from home.src.download.queue import PendingList
 from home.src.download.subscriptions import PlaylistSubscription
 from home.src.download.yt_dlp_base import YtWrap
-from home.src.es.connect import ElasticWrap, IndexPaginate
+from home.src.es.connect import ElasticWrap, IndexPaginate, RefreshPolicy
 from home.src.index.channel import YoutubeChannel
-from home.src.index.comments import CommentList
+from home.src.index.comments import Comments
 from home.src.index.playlist import YoutubePlaylist
 from home.src.index.video import YoutubeVideo, index_new_video
 from home.src.index.video_constants import VideoTypeEnum
 from home.src.ta.config import AppConfig
-from home.src.ta.helper import ignore_filelist
+from home.src.ta.helper import ignore_filelist, move_file
+from home.src.ta.rate_limit import BandwidthLimiter
+from home.src.ta.ta_redis import KnownIds, RedisLease
 
 
 class DownloadPostProcess:
@@ -33,6 +40,8 @@ class DownloadPostProcess:
 
     def run(self):
         """run all functions"""
+        # make downloads of this run visible for validation
+        RefreshPolicy.refresh_touched()
         self.pending = PendingList()
         self.pending.get_download()
         self.pending.get_channels()
@@ -40,7 +49,6 @@ class DownloadPostProcess:
         self.auto_delete_all()
         self.auto_delete_overwrites()
         self.validate_playlists()
-        self.get_comments()
 
     def auto_delete_all(self):
         """handle auto delete"""
@@ -108,7 +116,7 @@ class DownloadPostProcess:
 
     def _validate_channel_playlist(self, all_channel_playlist, id_c):
         """scan channel for playlist needing update"""
-        all_youtube_ids = [i["youtube_id"] for i in self.pending.all_videos]
+        all_youtube_ids = self.pending.all_video_ids
         for id_p, playlist_id in enumerate(all_channel_playlist):
             playlist = YoutubePlaylist(playlist_id)
             playlist.all_youtube_ids = all_youtube_ids
@@ -117,8 +125,8 @@ class DownloadPostProcess:
                 playlist.deactivate()
                 continue
 
-            playlist.add_vids_to_playlist()
             playlist.upload_to_es()
+            playlist.add_vids_to_playlist(playlist.get_changed_downloaded())
             self._notify_playlist_progress(all_channel_playlist, id_c, id_p)
 
     def _notify_playlist_progress(self, all_channel_playlist, id_c, id_p):
@@ -136,10 +144,6 @@ class DownloadPostProcess:
         progress = (id_c + 1) / total_channel
         self.download.task.send_progress(message, progress=progress)
 
-    def get_comments(self):
-        """get comments from youtube"""
-        CommentList(self.download.videos, task=self.download.task).index()
-
 
 class VideoDownloader:
     """
@@ -147,6 +151,8 @@ class VideoDownloader:
     if not initiated with list, take from queue
     """
 
+    PROGRESS_INTERVAL = 1
+
     def __init__(self, youtube_id_list=False, task=False):
         self.obs = False
         self.video_overwrites = False
@@ -156,62 +162,231 @@ class VideoDownloader:
         self._build_obs()
         self.channels = set()
         self.videos = set()
+        self.processed = set()
+        self.workers = int(self.config["downloads"]["download_workers"] or 1)
+        self.lease = RedisLease("download", uuid4().hex)
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.errors = []
+        self.bandwidth = BandwidthLimiter(self.config)
+        self.downloaded_bytes = {}
 
     def run_queue(self, auto_only=False):
         """setup download queue in redis loop until no more items"""
         self._get_overwrites()
+        stages = self._start_stages()
+        try:
+            self._run_downloads(auto_only, stages[0][0])
+        finally:
+            self._stop_stages(stages)
+
+        self._reset_auto()
+        if self.errors:
+            raise self.errors[0]
+
+        # post processing
+        self._add_subscribed_channels()
+        DownloadPostProcess(self).run()
+
+        return self.videos
+
+    def _start_stages(self):
+        """start thread per post download step, linked by bounded queues"""
+        steps = [self._index_video, self._archive_video]
+        if self.config["downloads"]["comment_max"]:
+            steps.append(self._index_comments)
+
+        queues = [Queue(maxsize=self.workers) for _ in steps] + [None]
+        stages = []
+        for idx, step in enumerate(steps):
+            in_queue, out_queue = queues[idx], queues[idx + 1]
+            context = contextvars.copy_context()
+            thread = threading.Thread(
+                target=context.run,
+                args=(self._run_stage, step, in_queue, out_queue),
+                name=f"download-{step.__name__.strip('_')}",
+                daemon=True,
+            )
+            thread.start()
+            stages.append((in_queue, thread))
+
+        return stages
+
+    def _stop_stages(self, stages):
+        """drain stages in order, keep publishing progress"""
+        stages[0][0].put(None)
+        for _, thread in stages:
+            while thread.is_alive():
+                thread.join(timeout=self.PROGRESS_INTERVAL)
+                self._notify_in_flight()
+
+    def _run_stage(self, step, in_queue, out_queue):
+        """process items from in_queue until sentinel"""
         while True:
-            video_data = self._get_next(auto_only)
-            if self.task.is_stopped() or not video_data:
-                self._reset_auto()
+            video_data = in_queue.get()
+            if video_data is None:
+                if out_queue:
+                    out_queue.put(None)
                 break
 
-            youtube_id = video_data.get("youtube_id")
-            print(f"{youtube_id}: Downloading video")
-            self._notify(video_data, "Validate download format")
-
-            success = self._dl_single_vid(youtube_id)
-            if not success:
-                continue
+            self._run_step(step, video_data, out_queue)
 
-            self._notify(video_data, "Add video metadata to index")
+    def _run_step(self, step, video_data, out_queue):
+        """run single step, pass on or finish video"""
+        try:
+            success = step(video_data)
+        except Exception as err:  # pylint: disable=broad-except
+            print(f"{video_data['youtube_id']}: {step.__name__} failed: {err}")
+            self.errors.append(err)
+            success = False
+
+        if success and out_queue:
+            # blocks while next stage is busy
+            out_queue.put(video_data)
+            return
 
-            vid_dict = index_new_video(
-                youtube_id,
-                video_overwrites=self.video_overwrites,
-                video_type=VideoTypeEnum(video_data["vid_type"]),
+        with self.lock:
+            self.in_flight.pop(video_data["youtube_id"], None)
+
+        self.lease.release(video_data["youtube_id"])
+
+    def _run_downloads(self, auto_only, index_queue):
+        """claim and download items until queue is empty or stopped"""
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="download"
+        ) as executor:
+            running = set()
+            refill = True
+            while True:
+                if refill and not self._is_stopped():
+                    added = self._add_workers(
+                        executor, running, auto_only, index_queue
+                    )
+                    running.update(added)
+
+                if not running:
+                    break
+
+                done, running = wait(
+                    running,
+                    timeout=self.PROGRESS_INTERVAL,
+                    return_when=FIRST_COMPLETED,
+                )
+                refill = bool(done)
+                self._notify_in_flight()
+
+    def _is_stopped(self):
+        """stop claiming new items on stop command or failure"""
+        return bool(self.errors) or self.task.is_stopped()
+
+    def _add_workers(self, executor, running, auto_only, index_queue):
+        """claim next items for idle workers and submit them"""
+        idle = self.workers - len(running)
+        if idle <= 0:
+            return set()
+
+        futures = set()
+        for video_data in self._get_next(auto_only, idle):
+            # each thread needs its own context for RefreshPolicy
+            context = contextvars.copy_context()
+            future = executor.submit(
+                context.run,
+                self._run_step,
+                self._download_video,
+                video_data,
+                index_queue,
             )
+            futures.add(future)
+
+        return futures
+
+    def _download_video(self, video_data):
+        """download stage"""
+        youtube_id = video_data["youtube_id"]
+        print(f"{youtube_id}: Downloading video")
+        self._notify(video_data, "Validate download format")
+        return self._dl_single_vid(youtube_id)
+
+    def _index_video(self, video_data):
+        """index stage, probe media file and add metadata"""
+        self._notify(video_data, "Add video metadata to index")
+        vid_dict = index_new_video(
+            video_data["youtube_id"],
+            video_overwrites=self.video_overwrites,
+            video_type=VideoTypeEnum(video_data["vid_type"]),
+        )
+        video_data["vid_dict"] = vid_dict
+        with self.lock:
             self.channels.add(vid_dict["channel"]["channel_id"])
             self.videos.add(vid_dict["youtube_id"])
 
-            self._notify(video_data, "Move downloaded file to archive")
-            self.move_to_archive(vid_dict)
-            self._delete_from_pending(youtube_id)
+        return True
 
-        # post processing
-        self._add_subscribed_channels()
-        DownloadPostProcess(self).run()
+    def _archive_video(self, video_data):
+        """archive stage, move media file and remove from queue"""
+        self._notify(video_data, "Move downloaded file to archive")
+        self.move_to_archive(video_data["vid_dict"])
+        self._delete_from_pending(video_data["youtube_id"])
+        return True
 
-        return self.videos
+    def _index_comments(self, video_data):
+        """comments stage, get comments right after archiving,
+        video is already archived, failure doesn't stop the queue"""
+        self._notify(video_data, "Add comments")
+        youtube_id = video_data["youtube_id"]
+        try:
+            comment = Comments(youtube_id, config=self.config)
+            comment.build_json()
+            if comment.json_data:
+                comment.upload_comments()
+        except Exception as err:  # pylint: disable=broad-except
+            print(f"{youtube_id}: failed to index comments: {err}")
 
-    def _notify(self, video_data, message):
-        """send progress notification to task"""
-        if not self.task:
-            return
+        return True
 
+    def _notify(self, video_data, message):
+        """set progress of in flight video, published from main thread"""
         typ = VideoTypeEnum(video_data["vid_type"]).value.rstrip("s").title()
         title = video_data.get("title")
-        self.task.send_progress([f"Processing {typ}: {title}", message])
+        with self.lock:
+            self.in_flight[video_data["youtube_id"]] = {
+                "title": f"Processing {typ}: {title}",
+                "message": message,
+                "progress": False,
+            }
+
+    def _notify_in_flight(self):
+        """send progress of all in flight videos to task"""
+        with self.lock:
+            in_flight = list(self.in_flight.values())
+            self.lease.renew(list(self.in_flight))
+
+        if not self.task or not in_flight:
+            return
+
+        message_lines = []
+        for video in in_flight:
+            message_lines.extend([video["title"], video["message"]])
+
+        progress = False
+        if any(i["progress"] for i in in_flight):
+            total = sum(i["progress"] or 0 for i in in_flight)
+            progress = total / len(in_flight)
+
+        self.task.send_progress(message_lines, progress=progress)
 
-    def _get_next(self, auto_only):
-        """get next item in queue"""
+    def _get_next(self, auto_only, size):
+        """claim up to size next items in queue"""
         must_list = [{"term": {"status": {"value": "pending"}}}]
         must_not_list = [{"exists": {"field": "message"}}]
+        if self.processed:
+            # queue changes might not be refreshed yet
+            must_not_list.append({"ids": {"values": list(self.processed)}})
         if auto_only:
             must_list.append({"term": {"auto_start": {"value": True}}})
 
         data = {
-            "size": 1,
+            "size": size * 2,
             "query": {"bool": {"must": must_list, "must_not": must_not_list}},
             "sort": [
                 {"auto_start": {"order": "desc"}},
@@ -220,10 +395,17 @@ class VideoDownloader:
         }
         path = "ta_download/_search"
         response, _ = ElasticWrap(path).get(data=data)
-        if not response["hits"]["hits"]:
-            return False
 
-        return response["hits"]["hits"][0]["_source"]
+        claimed = []
+        for hit in response["hits"]["hits"]:
+            youtube_id = hit["_source"]["youtube_id"]
+            if len(claimed) >= size or not self.lease.claim(youtube_id):
+                continue
+
+            self.processed.add(youtube_id)
+            claimed.append(hit["_source"])
+
+        return claimed
 
     def _get_overwrites(self):
         """get channel overwrites"""
@@ -248,9 +430,29 @@ class VideoDownloader:
         except KeyError:
             message = "processing"
 
-        if self.task:
-            title = response["info_dict"]["title"]
-            self.task.send_progress([title, message], progress=progress)
+        youtube_id = response["info_dict"]["id"]
+        with self.lock:
+            if youtube_id in self.in_flight:
+                self.in_flight[youtube_id].update(
+                    {"message": message, "progress": progress}
+                )
+
+        self._throttle(response)
+
+    def _throttle(self, response):
+        """block download thread while over global bandwidth"""
+        if response.get("status") != "downloading":
+            return
+
+        file_name = response.get("filename")
+        downloaded = response.get("downloaded_bytes") or 0
+        with self.lock:
+            last = self.downloaded_bytes.get(file_name, 0)
+            self.downloaded_bytes[file_name] = downloaded
+
+        # counter restarts on new file or fragment
+        delta = downloaded - last if downloaded >= last else downloaded
+        self.bandwidth.consume(delta)
 
     def _build_obs(self):
         """collection to build all obs passed to yt-dlp"""
@@ -281,11 +483,6 @@ class VideoDownloader:
             format_sort = self.config["downloads"]["format_sort"]
             format_sort_list = [i.strip() for i in format_sort.split(",")]
             self.obs["format_sort"] = format_sort_list
-        if self.config["downloads"]["limit_speed"]:
-            self.obs["ratelimit"] = (
-                self.config["downloads"]["limit_speed"] * 1024
-            )
-
         throttle = self.config["downloads"]["throttledratelimit"]
         if throttle:
             self.obs["throttledratelimit"] = throttle * 1024
@@ -354,8 +551,13 @@ class VideoDownloader:
 
         if self.obs["writethumbnail"]:
             # webp files don't get cleaned up automatically
+            # only clean own files, other workers share the cache
             all_cached = ignore_filelist(os.listdir(dl_cache))
-            to_clean = [i for i in all_cached if not i.endswith(".mp4")]
+            to_clean = [
+                i
+                for i in all_cached
+                if i.startswith(youtube_id) and not i.endswith(".mp4")
+            ]
             for file_name in to_clean:
                 file_path = os.path.join(dl_cache, file_name)
                 os.remove(file_path)
@@ -385,15 +587,17 @@ class VideoDownloader:
         old_path = os.path.join(cache_dir, "download", media_file)
         new_path = os.path.join(videos, vid_dict["media_url"])
         # move media file and fix permission
-        shutil.move(old_path, new_path, copy_function=shutil.copyfile)
+        move_file(old_path, new_path)
         if host_uid and host_gid:
             os.chown(new_path, host_uid, host_gid)
 
     @staticmethod
     def _delete_from_pending(youtube_id):
         """delete downloaded video from pending index if its there"""
-        path = f"ta_download/_doc/{youtube_id}?refresh=true"
-        _, _ = ElasticWrap(path).delete()
+        path = f"ta_download/_doc/{youtube_id}"
+        _, _ = ElasticWrap(path).delete(refresh=True)
+        KnownIds().remove([youtube_id], states=["pending"])
+        RefreshPolicy.bump_version()
 
     def _add_subscribed_channels(self):
         """add all channels subscribed to refresh"""
@@ -10,9 +10,11 @@ import os
 import zipfile
 from datetime import datetime
 
+from home.src.es.bulk import BulkWriter
 from home.src.es.connect import ElasticWrap, IndexPaginate
 from home.src.ta.config import AppConfig
 from home.src.ta.helper import get_mapping, ignore_filelist
+from home.src.ta.ta_redis import KnownIds
 
 
 class ElasticBackup:
@@ -58,8 +60,9 @@ class ElasticBackup:
             callback=BackupCallback,
             task=self.task,
             total=self._get_total(index_name),
+            slices=4,
         )
-        _ = paginate.get_results()
+        paginate.run_callbacks()
 
     @staticmethod
     def _get_total(index_name):
@@ -91,15 +94,15 @@ class ElasticBackup:
             os.remove(backup_file)
 
     def post_bulk_restore(self, file_name):
-        """send bulk to es"""
+        """stream bulk file to es"""
         file_path = os.path.join(self.cache_dir, file_name)
         with open(file_path, "r", encoding="utf-8") as f:
-            data = f.read()
+            with BulkWriter(refresh=True, background=True) as bulk:
+                for line in f:
+                    if not line.strip():
+                        continue
 
-        if not data.strip():
-            return
-
-        _, _ = ElasticWrap("_bulk").post(data=data, ndjson=True)
+                    bulk.add_lines(line.strip(), next(f).strip())
 
     def get_all_backup_files(self):
         """build all available backup files for view"""
@@ -139,6 +142,7 @@ class ElasticBackup:
         """
         zip_content = self._unpack_zip_backup(filename)
         self._restore_json_files(zip_content)
+        KnownIds().invalidate()
 
     def _unpack_zip_backup(self, filename):
         """extract backup zip and return filelist"""
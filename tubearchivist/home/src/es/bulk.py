@@ -0,0 +1,173 @@
+"""
+functionality:
+- buffer nd-json bulk actions and send them to es in batches
+- retry rejected items, collect per item failures
+"""
+
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+from home.src.es.connect import ElasticWrap, RefreshPolicy
+
+
+class BulkWriter:
+    """write bulk actions to es, flush on document count or payload size
+    kwargs:
+    - max_docs: int, overwrite MAX_DOCS actions per request
+    - max_bytes: int, overwrite MAX_BYTES payload size per request
+    - refresh: bool, refresh all touched indexes once on close,
+      deferred by RefreshPolicy in background tasks
+    - background: bool, send requests from background thread
+    - ignore_status: tuple, item status codes not counted as failure
+    """
+
+    MAX_DOCS = 500
+    MAX_BYTES = 5 * 1024 * 1024
+    RETRIES = 3
+    RETRY_STATUS = (429,)
+    BACKOFF = 2
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.max_docs = kwargs.get("max_docs") or self.MAX_DOCS
+        self.max_bytes = kwargs.get("max_bytes") or self.MAX_BYTES
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.indexes = set()
+        self.failed = []
+        self.sent = 0
+        self.executor = False
+        self.in_flight = False
+        if kwargs.get("background"):
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="bulk"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, action, source=None):
+        """add action dict, with source for all but delete"""
+        action_line = json.dumps(action)
+        source_line = json.dumps(source) if source is not None else None
+        self.add_lines(action_line, source_line)
+
+    def add_lines(self, action_line, source_line=None):
+        """add already serialized nd-json lines"""
+        _, meta = next(iter(json.loads(action_line).items()))
+        if meta.get("_index"):
+            self.indexes.add(meta["_index"])
+
+        self.buffer.append((action_line, source_line))
+        self.buffer_bytes += len(action_line) + len(source_line or "") + 2
+        if (
+            len(self.buffer) >= self.max_docs
+            or self.buffer_bytes >= self.max_bytes
+        ):
+            self.flush()
+
+    def flush(self):
+        """send buffered actions"""
+        if not self.buffer:
+            return
+
+        entries = self.buffer
+        self.buffer = []
+        self.buffer_bytes = 0
+
+        if not self.executor:
+            self._send(entries)
+            return
+
+        # keep at most one request in flight, in context for RefreshPolicy
+        self._wait()
+        context = contextvars.copy_context()
+        self.in_flight = self.executor.submit(context.run, self._send, entries)
+
+    def close(self):
+        """flush remaining, wait for background and refresh once"""
+        self.flush()
+        self._wait()
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+        if self.kwargs.get("refresh") and self.indexes:
+            RefreshPolicy.refresh(self.indexes)
+
+        if self.failed:
+            print(f"bulk: {len(self.failed)}/{self.sent} items failed")
+            for failed in self.failed[:5]:
+                print(f"bulk: {failed}")
+
+        return self.failed
+
+    def _wait(self):
+        """block until in flight request is done, raise its error"""
+        if self.in_flight:
+            self.in_flight.result()
+            self.in_flight = False
+
+    def _send(self, entries):
+        """send entries, retry rejected items with backoff"""
+        self.sent += len(entries)
+        for attempt in range(self.RETRIES + 1):
+            if attempt:
+                sleep(self.BACKOFF**attempt)
+
+            entries = self._post(entries, is_last=attempt == self.RETRIES)
+            if not entries:
+                return
+
+    def _post(self, entries, is_last):
+        """single bulk request, return entries to retry"""
+        lines = []
+        for action_line, source_line in entries:
+            lines.append(action_line)
+            if source_line is not None:
+                lines.append(source_line)
+
+        lines.append("\n")
+        response, status_code = ElasticWrap("_bulk").post(
+            data="\n".join(lines), ndjson=True
+        )
+        if status_code != 200:
+            if status_code in self.RETRY_STATUS and not is_last:
+                return entries
+
+            self._add_failed(entries, status_code, response.get("error"))
+            return []
+
+        if not response.get("errors"):
+            return []
+
+        return self._parse_items(entries, response["items"], is_last)
+
+    def _parse_items(self, entries, items, is_last):
+        """collect failed items, return retryable entries"""
+        to_retry = []
+        ignore_status = self.kwargs.get("ignore_status") or ()
+        for entry, item in zip(entries, items):
+            _, result = next(iter(item.items()))
+            status = result.get("status")
+            if status < 300 or status in ignore_status:
+                continue
+
+            if status in self.RETRY_STATUS and not is_last:
+                to_retry.append(entry)
+                continue
+
+            self._add_failed([entry], status, result.get("error"))
+
+        return to_retry
+
+    def _add_failed(self, entries, status, error):
+        """remember failed entries"""
+        for action_line, _ in entries:
+            self.failed.append(
+                {"action": action_line, "status": status, "error": error}
+            )
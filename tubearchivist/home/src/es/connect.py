@@ -2,13 +2,200 @@
 functionality:
 - wrapper around requests to call elastic search
 - reusable search_after to extract total index
+- shared connection pool for all calls to elastic search
 """
-# pylint: disable=missing-timeout
 
 import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from copy import deepcopy
+from queue import Full, Queue
+from time import perf_counter
 
 import requests
+from home.src.es.metrics import ElasticMetrics
 from home.src.ta.config import AppConfig
+from home.src.ta.ta_redis import IndexVersion
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class ElasticSession:
+    """process wide pooled requests session with keep-alive and retry
+    configure with env vars:
+    - ES_POOL_SIZE: int, max connections kept open per host
+    - ES_CONNECT_TIMEOUT: float, seconds to establish connection
+    - ES_READ_TIMEOUT: float, seconds to wait for response
+    - ES_RETRIES: int, retries on 429 and 503 responses
+    """
+
+    POOL_SIZE: int = int(os.environ.get("ES_POOL_SIZE") or 10)
+    CONNECT_TIMEOUT: float = float(os.environ.get("ES_CONNECT_TIMEOUT") or 5)
+    READ_TIMEOUT: float = float(os.environ.get("ES_READ_TIMEOUT") or 60)
+    RETRIES: int = int(os.environ.get("ES_RETRIES") or 3)
+    RETRY_STATUS: tuple = (429, 503)
+
+    _lock = threading.Lock()
+    _session = False
+    _pid = False
+
+    @classmethod
+    def get(cls):
+        """get session, build new one after fork"""
+        if cls._session and cls._pid == os.getpid():
+            return cls._session
+
+        with cls._lock:
+            if not cls._session or cls._pid != os.getpid():
+                cls._session = cls._build_session()
+                cls._pid = os.getpid()
+
+        return cls._session
+
+    @classmethod
+    def _build_session(cls):
+        """create session with mounted pooled adapter"""
+        retry = Retry(
+            total=cls.RETRIES,
+            connect=cls.RETRIES,
+            read=0,
+            status=cls.RETRIES,
+            status_forcelist=cls.RETRY_STATUS,
+            backoff_factor=0.5,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=cls.POOL_SIZE,
+            pool_maxsize=cls.POOL_SIZE,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        return session
+
+    @classmethod
+    def timeout(cls, read_timeout=False):
+        """build connect and read timeout tuple, None to wait forever"""
+        if read_timeout is None:
+            return (cls.CONNECT_TIMEOUT, None)
+
+        return (cls.CONNECT_TIMEOUT, read_timeout or cls.READ_TIMEOUT)
+
+    @classmethod
+    def get_stats(cls):
+        """connections opened vs reused in this process"""
+        opened, requested = 0, 0
+        if cls._session and cls._pid == os.getpid():
+            for adapter in set(cls._session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if not pool:
+                        continue
+
+                    opened += pool.num_connections
+                    requested += pool.num_requests
+
+        return {
+            "pid": os.getpid(),
+            "pool_size": cls.POOL_SIZE,
+            "requests": requested,
+            "connections_opened": opened,
+            "connections_reused": max(requested - opened, 0),
+        }
+
+
+class RefreshPolicy:
+    """refresh strategy for writes asking for refresh
+    interactive: ES_REFRESH_INTERACTIVE, default wait_for
+    background: don't refresh, remember touched indexes and
+    refresh them once when the background context finishes,
+    bump IndexVersion only after the writes are visible
+    """
+
+    INTERACTIVE: str = os.environ.get("ES_REFRESH_INTERACTIVE") or "wait_for"
+
+    _state: ContextVar = ContextVar("es_refresh_state", default=False)
+    # state is shared with worker threads through copied contexts
+    _lock = threading.Lock()
+
+    @classmethod
+    def start_background(cls):
+        """defer refreshes in current context"""
+        cls._state.set({"touched": set(), "bump": False})
+
+    @classmethod
+    def finish_background(cls):
+        """refresh touched indexes, back to interactive"""
+        cls.refresh_touched()
+        cls._state.set(False)
+
+    @classmethod
+    def get_value(cls, index_name, by_query=False):
+        """get refresh param value, False for no refresh"""
+        state = cls._state.get()
+        if state:
+            with cls._lock:
+                state["touched"].add(index_name)
+
+            return False
+
+        if by_query:
+            # _by_query endpoints only accept true or false
+            return "true"
+
+        return cls.INTERACTIVE
+
+    @classmethod
+    def refresh(cls, indexes):
+        """refresh indexes now or defer in background"""
+        state = cls._state.get()
+        if state:
+            with cls._lock:
+                state["touched"].update(indexes)
+
+            return
+
+        cls._refresh(indexes)
+
+    @classmethod
+    def bump_version(cls):
+        """bump IndexVersion now or after deferred refresh"""
+        state = cls._state.get()
+        if state:
+            with cls._lock:
+                state["bump"] = True
+
+            return
+
+        IndexVersion().bump()
+
+    @classmethod
+    def refresh_touched(cls):
+        """refresh all indexes touched so far in background context"""
+        state = cls._state.get()
+        if not state:
+            return
+
+        with cls._lock:
+            touched, state["touched"] = state["touched"], set()
+            bump, state["bump"] = state["bump"], False
+
+        if touched:
+            cls._refresh(touched)
+
+        if bump:
+            IndexVersion().bump()
+
+    @staticmethod
+    def _refresh(indexes):
+        """explicit refresh call"""
+        path = f"{','.join(sorted(indexes))}/_refresh"
+        _, _ = ElasticWrap(path).post()
 
 
 class ElasticWrap:
@@ -16,6 +203,9 @@ class ElasticWrap:
     returns response json and status code tuple
     """
 
+    # server keeps working after client timeout, wait for these
+    LONG_RUNNING = ["_by_query", "_refresh", "_reindex", "_snapshot", "_slm"]
+
     def __init__(self, path, config=False):
         self.url = False
         self.auth = False
@@ -34,19 +224,23 @@ class ElasticWrap:
 
     def get(self, data=False, timeout=10, print_error=True):
         """get data from es"""
+        session = ElasticSession.get()
+        timeout = ElasticSession.timeout(timeout)
+        start = perf_counter()
         if data:
-            response = requests.get(
+            response = session.get(
                 self.url, json=data, auth=self.auth, timeout=timeout
             )
         else:
-            response = requests.get(self.url, auth=self.auth, timeout=timeout)
+            response = session.get(self.url, auth=self.auth, timeout=timeout)
         if print_error and not response.ok:
             print(response.text)
 
-        return response.json(), response.status_code
+        return self._finish("GET", response, start)
 
-    def post(self, data=False, ndjson=False):
-        """post data to es"""
+    def post(self, data=False, ndjson=False, refresh=False, timeout=False):
+        """post data to es, timeout=None for long running calls"""
+        self._add_refresh(refresh)
         if ndjson:
             headers = {"Content-type": "application/x-ndjson"}
             payload = data
@@ -54,43 +248,140 @@ class ElasticWrap:
             headers = {"Content-type": "application/json"}
             payload = json.dumps(data)
 
+        session = ElasticSession.get()
+        timeout = self._get_timeout(timeout)
+        start = perf_counter()
         if data:
-            response = requests.post(
-                self.url, data=payload, headers=headers, auth=self.auth
+            response = session.post(
+                self.url,
+                data=payload,
+                headers=headers,
+                auth=self.auth,
+                timeout=timeout,
             )
         else:
-            response = requests.post(self.url, headers=headers, auth=self.auth)
+            response = session.post(
+                self.url, headers=headers, auth=self.auth, timeout=timeout
+            )
 
         if not response.ok:
             print(response.text)
 
-        return response.json(), response.status_code
+        return self._finish("POST", response, start)
 
     def put(self, data, refresh=False):
         """put data to es"""
-        if refresh:
-            self.url = f"{self.url}/?refresh=true"
-        response = requests.put(f"{self.url}", json=data, auth=self.auth)
+        self._add_refresh(refresh)
+        start = perf_counter()
+        response = ElasticSession.get().put(
+            f"{self.url}",
+            json=data,
+            auth=self.auth,
+            timeout=self._get_timeout(False),
+        )
         if not response.ok:
             print(response.text)
             print(data)
+            self._finish("PUT", response, start, parse=False)
             raise ValueError("failed to add item to index")
 
-        return response.json(), response.status_code
+        return self._finish("PUT", response, start)
 
-    def delete(self, data=False, refresh=False):
+    def delete(self, data=False, refresh=False, timeout=False):
         """delete document from es"""
-        if refresh:
-            self.url = f"{self.url}/?refresh=true"
+        self._add_refresh(refresh)
+        session = ElasticSession.get()
+        timeout = self._get_timeout(timeout)
+        start = perf_counter()
         if data:
-            response = requests.delete(self.url, json=data, auth=self.auth)
+            response = session.delete(
+                self.url, json=data, auth=self.auth, timeout=timeout
+            )
         else:
-            response = requests.delete(self.url, auth=self.auth)
+            response = session.delete(
+                self.url, auth=self.auth, timeout=timeout
+            )
 
         if not response.ok:
             print(response.text)
 
-        return response.json(), response.status_code
+        return self._finish("DELETE", response, start)
+
+    def _get_timeout(self, timeout):
+        """build timeout, no read timeout for long running paths"""
+        if timeout is False:
+            path = self.path.split("?")[0]
+            if any(i in path for i in self.LONG_RUNNING):
+                timeout = None
+
+        return ElasticSession.timeout(timeout)
+
+    def _add_refresh(self, refresh):
+        """add refresh param to url based on RefreshPolicy"""
+        if not refresh:
+            return
+
+        index_name = self.path.split("/")[0]
+        if index_name.startswith("_"):
+            index_name = "_all"
+
+        by_query = "_by_query" in self.path
+        value = RefreshPolicy.get_value(index_name, by_query=by_query)
+        if not value:
+            return
+
+        separator = "&" if "?" in self.url else "?"
+        self.url = f"{self.url}{separator}refresh={value}"
+
+    def _finish(self, method, response, start, parse=True):
+        """parse response, record call metrics"""
+        rtt = perf_counter() - start
+        response_json = response.json() if parse else False
+        took = False
+        if isinstance(response_json, dict):
+            took = response_json.get("took")
+
+        ElasticMetrics.record(method, self.path, response, rtt, took)
+
+        return response_json, response.status_code
+
+
+class MultiSearch:
+    """bundle independent searches into a single _msearch round trip
+    responses are returned in the order the searches were added
+    """
+
+    def __init__(self, config=False):
+        self.config = config
+        self.searches = []
+
+    def add(self, index_name, data):
+        """add search, return position in responses"""
+        self.searches.append((index_name, data))
+        return len(self.searches) - 1
+
+    def run(self):
+        """send all searches, failed searches return empty hits"""
+        if not self.searches:
+            return []
+
+        lines = []
+        for index_name, data in self.searches:
+            lines.append(json.dumps({"index": index_name}))
+            lines.append(json.dumps(data))
+
+        lines.append("\n")
+        response, _ = ElasticWrap("_msearch", config=self.config).post(
+            data="\n".join(lines), ndjson=True
+        )
+        responses = response.get("responses") or [{}] * len(self.searches)
+        for idx, single in enumerate(responses):
+            if "error" in single:
+                print(f"msearch {self.searches[idx][0]}: {single['error']}")
+
+            single.setdefault("hits", {"total": {"value": 0}, "hits": []})
+
+        return responses
 
 
 class IndexPaginate:
@@ -101,9 +392,13 @@ class IndexPaginate:
     - callback: obj, Class implementing run method callback for every loop
     - task: task object to send notification
     - total: int, total items in index for progress message
+    - slices: int, split into sliced searches running in parallel,
+      only for cheap consumers, slow callbacks are the bottleneck
+    - ordered: bool, with slices, deliver slice by slice in order
     """
 
     DEFAULT_SIZE = 500
+    SLICE_BUFFER = 2
 
     def __init__(self, index_name, data, **kwargs):
         self.index_name = index_name
@@ -113,11 +408,33 @@ class IndexPaginate:
 
     def get_results(self):
         """get all results, add task and total for notifications"""
+        return list(self.iter_hits())
+
+    def run_callbacks(self):
+        """walk index for callback and notifications, keep nothing"""
+        for _ in self.iter_pages():
+            pass
+
+    def iter_hits(self):
+        """yield hit by hit, _source only unless keep_source"""
+        keep_source = self.kwargs.get("keep_source")
+        for all_hits in self.iter_pages():
+            for hit in all_hits:
+                yield hit if keep_source else hit["_source"]
+
+    def iter_pages(self):
+        """yield page by page, pit gets cleaned when done or closed"""
         self.get_pit()
-        self.validate_data()
-        all_results = self.run_loop()
-        self.clean_pit()
-        return all_results
+        try:
+            self.validate_data()
+            if (self.kwargs.get("slices") or 1) > 1:
+                pages = self._run_sliced()
+            else:
+                pages = self._search_pages(self.data)
+
+            yield from self.run_loop(pages)
+        finally:
+            self.clean_pit()
 
     def get_pit(self):
         """get pit for index"""
@@ -139,35 +456,98 @@ class IndexPaginate:
         self.data["size"] = self.kwargs.get("size") or self.DEFAULT_SIZE
         self.data["pit"] = {"id": self.pit_id, "keep_alive": "10m"}
 
-    def run_loop(self):
-        """loop through results until last hit"""
-        all_results = []
-        counter = 0
-        while True:
-            response, _ = ElasticWrap("_search").get(data=self.data)
-            all_hits = response["hits"]["hits"]
-            if not all_hits:
-                break
-
-            for hit in all_hits:
-                if self.kwargs.get("keep_source"):
-                    all_results.append(hit)
-                else:
-                    all_results.append(hit["_source"])
-
+    def run_loop(self, pages):
+        """run callback and notification for every page"""
+        processed = 0
+        for counter, all_hits in enumerate(pages):
             if self.kwargs.get("callback"):
                 self.kwargs.get("callback")(all_hits, self.index_name).run()
 
+            processed += len(all_hits)
             if self.kwargs.get("task"):
                 print(f"{self.index_name}: processing page {counter}")
-                self._notify(len(all_results))
+                self._notify(processed)
 
-            counter += 1
+            yield all_hits
 
-            # update search_after with last hit data
-            self.data["search_after"] = all_hits[-1]["sort"]
+    @staticmethod
+    def _search_pages(data):
+        """loop through results until last hit"""
+        while True:
+            response, _ = ElasticWrap("_search").get(data=data)
+            all_hits = response["hits"]["hits"]
+            if not all_hits:
+                break
 
-        return all_results
+            # update search_after with last hit data
+            data["search_after"] = all_hits[-1]["sort"]
+            yield all_hits
+
+    def _run_sliced(self):
+        """run sliced searches in thread pool, yield pages from queues"""
+        slices = self.kwargs.get("slices")
+        stop = threading.Event()
+        if self.kwargs.get("ordered"):
+            queues = [Queue(maxsize=self.SLICE_BUFFER) for _ in range(slices)]
+        else:
+            queues = [Queue(maxsize=self.SLICE_BUFFER * slices)] * slices
+
+        executor = ThreadPoolExecutor(
+            max_workers=slices, thread_name_prefix=f"{self.index_name}-slice"
+        )
+        try:
+            for slice_id, out_queue in enumerate(queues):
+                executor.submit(self._slice_worker, slice_id, out_queue, stop)
+
+            if self.kwargs.get("ordered"):
+                for out_queue in queues:
+                    yield from self._drain(out_queue, expected=1)
+            else:
+                yield from self._drain(queues[0], expected=slices)
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+
+    def _slice_worker(self, slice_id, out_queue, stop):
+        """search single slice, finish with None or the exception"""
+        data = deepcopy(self.data)
+        data["slice"] = {"id": slice_id, "max": self.kwargs.get("slices")}
+        try:
+            for all_hits in self._search_pages(data):
+                if not self._put(out_queue, all_hits, stop):
+                    return
+        except Exception as err:  # pylint: disable=broad-except
+            self._put(out_queue, err, stop)
+            return
+
+        self._put(out_queue, None, stop)
+
+    @staticmethod
+    def _put(out_queue, item, stop):
+        """put to bounded queue, give up when stopped"""
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=1)
+                return True
+            except Full:
+                continue
+
+        return False
+
+    @staticmethod
+    def _drain(out_queue, expected):
+        """yield pages until all expected slices are done"""
+        finished = 0
+        while finished < expected:
+            item = out_queue.get()
+            if item is None:
+                finished += 1
+                continue
+
+            if isinstance(item, Exception):
+                raise item
+
+            yield item
 
     def _notify(self, processed):
         """send notification on task"""
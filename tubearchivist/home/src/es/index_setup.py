@@ -113,7 +113,9 @@ class ElasticIndex:
             destination = f"ta_{self.index_name}"
 
         data = {"source": {"index": source}, "dest": {"index": destination}}
-        _, _ = ElasticWrap("_reindex?refresh=true").post(data=data)
+        _, _ = ElasticWrap("_reindex?refresh=true").post(
+            data=data, timeout=None
+        )
 
     def delete_index(self, backup=True):
         """delete index passed as argument"""
@@ -0,0 +1,232 @@
+"""
+functionality:
+- record timing and size of every call to elastic search
+- aggregate latency histograms per endpoint in process, flush to redis
+- keep ring buffer of slow calls in redis
+"""
+
+import atexit
+import json
+import os
+import threading
+from datetime import datetime
+from time import time
+
+from home.src.ta.ta_redis import RedisArchivist
+
+
+class ElasticMetrics:
+    """process wide collector for es call metrics"""
+
+    BUCKETS: list[int] = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+    FLUSH_INTERVAL: int = 10
+    SLOW_MS: int = int(os.environ.get("ES_SLOW_MS") or 1000)
+    SLOW_KEEP: int = 100
+    PAYLOAD_KEEP: int = 1000
+    KEY_BASE: str = "es:stats:"
+    KEY_ENDPOINTS: str = "es:endpoints"
+    KEY_SLOW: str = "es:slow"
+    API_VERBS: frozenset[str] = frozenset(
+        [
+            "_all",
+            "_bulk",
+            "_cat",
+            "_cluster",
+            "_count",
+            "_delete_by_query",
+            "_doc",
+            "_execute",
+            "_ingest",
+            "_mapping",
+            "_msearch",
+            "_nodes",
+            "_pit",
+            "_refresh",
+            "_reindex",
+            "_restore",
+            "_search",
+            "_settings",
+            "_slm",
+            "_snapshot",
+            "_update",
+            "_update_by_query",
+            "health",
+            "pipeline",
+            "policy",
+            "settings",
+        ]
+    )
+
+    _lock = threading.Lock()
+    _pending: dict = {}
+    _last_flush: float = time()
+    _pid: int = os.getpid()
+
+    @classmethod
+    def record(cls, method, path, response, rtt, took):
+        """record single call, flush when interval passed"""
+        rtt_ms = round(rtt * 1000, 2)
+        request_body = response.request.body or b""
+        call = {
+            "method": method,
+            "endpoint": cls.normalize(path),
+            "request_bytes": len(request_body),
+            "response_bytes": len(response.content),
+            "rtt_ms": rtt_ms,
+            "took_ms": took or 0,
+        }
+        with cls._lock:
+            if cls._pid != os.getpid():
+                # forked, don't count parent stats twice
+                cls._pending = {}
+                cls._pid = os.getpid()
+
+            cls._add(call)
+            to_flush = False
+            if time() - cls._last_flush > cls.FLUSH_INTERVAL:
+                to_flush = cls._pending
+                cls._pending = {}
+                cls._last_flush = time()
+
+        if rtt_ms > cls.SLOW_MS:
+            cls._add_slow(call, path, request_body)
+
+        if to_flush:
+            cls._write(to_flush)
+
+    @classmethod
+    def normalize(cls, path):
+        """replace index and ids by position, keep known api verbs"""
+        parts = path.split("?")[0].strip("/").split("/")
+        if parts == [""]:
+            return "/"
+
+        endpoint = []
+        for idx, part in enumerate(parts):
+            if part in cls.API_VERBS:
+                endpoint.append(part)
+            elif not idx:
+                endpoint.append("{index}")
+            else:
+                endpoint.append("{id}")
+
+        return "/".join(endpoint)
+
+    @classmethod
+    def _add(cls, call):
+        """add call to pending aggregation"""
+        key = f"{call['method']} {call['endpoint']}"
+        stats = cls._pending.setdefault(key, {})
+        for field in ["request_bytes", "response_bytes", "rtt_ms", "took_ms"]:
+            stats[field] = stats.get(field, 0) + call[field]
+
+        stats["count"] = stats.get("count", 0) + 1
+        bucket = next((i for i in cls.BUCKETS if call["rtt_ms"] <= i), "inf")
+        stats[f"le_{bucket}"] = stats.get(f"le_{bucket}", 0) + 1
+
+    @classmethod
+    def _add_slow(cls, call, path, request_body):
+        """add call to slow ring buffer"""
+        if isinstance(request_body, bytes):
+            request_body = request_body.decode(errors="replace")
+
+        slow = call.copy()
+        slow.update(
+            {
+                "path": path,
+                "payload": request_body[: cls.PAYLOAD_KEEP],
+                "timestamp": int(datetime.now().timestamp()),
+            }
+        )
+        key = RedisArchivist.NAME_SPACE + cls.KEY_SLOW
+        try:
+            pipeline = RedisArchivist().conn.pipeline(transaction=False)
+            pipeline.lpush(key, json.dumps(slow))
+            pipeline.ltrim(key, 0, cls.SLOW_KEEP - 1)
+            pipeline.execute()
+        except Exception:  # pylint: disable=broad-except
+            print(f"es metrics: failed to store slow call {path}")
+
+    @classmethod
+    def _write(cls, to_flush):
+        """write aggregated stats to redis in one pipeline"""
+        namespace = RedisArchivist.NAME_SPACE
+        try:
+            pipeline = RedisArchivist().conn.pipeline(transaction=False)
+            for key, stats in to_flush.items():
+                pipeline.sadd(namespace + cls.KEY_ENDPOINTS, key)
+                for field, value in stats.items():
+                    pipeline.hincrbyfloat(
+                        namespace + cls.KEY_BASE + key, field, value
+                    )
+
+            pipeline.execute()
+        except Exception:  # pylint: disable=broad-except
+            print("es metrics: failed to flush stats to redis")
+
+    @classmethod
+    def flush(cls):
+        """write all pending stats now"""
+        with cls._lock:
+            to_flush = cls._pending
+            cls._pending = {}
+            cls._last_flush = time()
+
+        if to_flush:
+            cls._write(to_flush)
+
+    @classmethod
+    def get_stats(cls):
+        """read endpoint histograms and slow calls from redis"""
+        cls.flush()
+        namespace = RedisArchivist.NAME_SPACE
+        conn = RedisArchivist().conn
+        endpoints = sorted(
+            i.decode() for i in conn.smembers(namespace + cls.KEY_ENDPOINTS)
+        )
+        pipeline = conn.pipeline(transaction=False)
+        for key in endpoints:
+            pipeline.hgetall(namespace + cls.KEY_BASE + key)
+
+        all_stats = {}
+        for key, raw in zip(endpoints, pipeline.execute()):
+            all_stats[key] = cls._parse_stats(raw)
+
+        slow = conn.lrange(namespace + cls.KEY_SLOW, 0, -1)
+
+        return {
+            "endpoints": all_stats,
+            "slow": [json.loads(i) for i in slow],
+        }
+
+    @classmethod
+    def _parse_stats(cls, raw):
+        """build endpoint stats dict from redis hash"""
+        stats = {k.decode(): float(v) for k, v in raw.items()}
+        count = int(stats.get("count", 0))
+        histogram = {str(i): int(stats.get(f"le_{i}", 0)) for i in cls.BUCKETS}
+        histogram["inf"] = int(stats.get("le_inf", 0))
+
+        return {
+            "count": count,
+            "avg_rtt_ms": round(stats.get("rtt_ms", 0) / (count or 1), 2),
+            "avg_took_ms": round(stats.get("took_ms", 0) / (count or 1), 2),
+            "request_bytes": int(stats.get("request_bytes", 0)),
+            "response_bytes": int(stats.get("response_bytes", 0)),
+            "histogram_ms": histogram,
+        }
+
+    @classmethod
+    def reset(cls):
+        """delete all recorded stats"""
+        namespace = RedisArchivist.NAME_SPACE
+        conn = RedisArchivist().conn
+        endpoints = conn.smembers(namespace + cls.KEY_ENDPOINTS)
+        to_delete = [namespace + cls.KEY_BASE + i.decode() for i in endpoints]
+        to_delete.extend(
+            [namespace + cls.KEY_ENDPOINTS, namespace + cls.KEY_SLOW]
+        )
+        conn.delete(*to_delete)
+
+
+atexit.register(ElasticMetrics.flush)
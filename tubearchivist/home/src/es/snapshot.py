@@ -10,6 +10,7 @@ from zoneinfo import ZoneInfo
 
 from home.src.es.connect import ElasticWrap
 from home.src.ta.helper import get_mapping
+from home.src.ta.ta_redis import KnownIds
 
 
 class ElasticSnapshot:
@@ -146,7 +147,7 @@ class ElasticSnapshot:
     def take_snapshot_now(self, wait=False):
         """execute daily snapshot now"""
         path = f"_slm/policy/{self.POLICY}/_execute"
-        response, statuscode = ElasticWrap(path).post()
+        response, statuscode = ElasticWrap(path).post(timeout=None)
         if statuscode == 200:
             print(f"snapshot: executing now: {response}")
 
@@ -266,8 +267,9 @@ class ElasticSnapshot:
 
         path = f"_snapshot/{self.REPO}/{snapshot_name}/_restore"
         data = {"indices": "*"}
-        response, statuscode = ElasticWrap(path).post(data=data)
+        response, statuscode = ElasticWrap(path).post(data=data, timeout=None)
         if statuscode == 200:
+            KnownIds().invalidate()
             print(f"snapshot: executing now: {response}")
             return response
 
@@ -277,7 +279,7 @@ class ElasticSnapshot:
     def delete_single_snapshot(self, snapshot_id):
         """delete single snapshot from index"""
         path = f"_snapshot/{self.REPO}/{snapshot_id}"
-        response, statuscode = ElasticWrap(path).delete()
+        response, statuscode = ElasticWrap(path).delete(timeout=None)
         if statuscode == 200:
             print(f"snapshot: deleting {snapshot_id} {response}")
             return response
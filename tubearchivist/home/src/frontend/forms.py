@@ -5,6 +5,7 @@
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
 from django.forms.widgets import PasswordInput, TextInput
+from home.src.ta.rate_limit import BandwidthLimiter
 
 
 class CustomAuthForm(AuthenticationForm):
@@ -113,10 +114,18 @@ class ApplicationSettingsForm(forms.Form):
     subscriptions_shorts_channel_size = forms.IntegerField(
         required=False, min_value=0
     )
+    subscriptions_scan_floor = forms.IntegerField(required=False, min_value=1)
+    subscriptions_scan_ceiling = forms.IntegerField(
+        required=False, min_value=1
+    )
     subscriptions_auto_start = forms.ChoiceField(
         widget=forms.Select, choices=AUTOSTART_CHOICES, required=False
     )
     downloads_limit_speed = forms.IntegerField(required=False)
+    downloads_limit_speed_schedule = forms.CharField(required=False)
+    downloads_download_workers = forms.IntegerField(
+        required=False, min_value=1
+    )
     downloads_throttledratelimit = forms.IntegerField(required=False)
     downloads_sleep_interval = forms.IntegerField(required=False)
     downloads_autodelete_days = forms.IntegerField(required=False)
@@ -153,6 +162,21 @@ class ApplicationSettingsForm(forms.Form):
         widget=forms.Select, choices=SNAPSHOT_CHOICES, required=False
     )
 
+    def clean_downloads_limit_speed_schedule(self):
+        """validate HH:MM-HH:MM=KB windows"""
+        schedule = self.cleaned_data["downloads_limit_speed_schedule"]
+        for window in schedule.split(","):
+            if not window.strip():
+                continue
+
+            try:
+                BandwidthLimiter.parse_window(window.strip())
+            except ValueError as err:
+                message = f"invalid schedule window: {window}"
+                raise forms.ValidationError(message) from err
+
+        return schedule
+
 
 class SchedulerSettingsForm(forms.Form):
     """handle scheduler settings"""
@@ -5,7 +5,7 @@ functionality:
 
 from datetime import datetime
 
-from home.src.es.connect import ElasticWrap
+from home.src.es.connect import ElasticWrap, RefreshPolicy
 from home.src.ta.urlparser import Parser
 
 
@@ -24,12 +24,17 @@ class WatchState:
         url_type = self._dedect_type()
         if url_type == "video":
             self.change_vid_state()
-            return
+        else:
+            self._change_by_query(url_type)
 
+        RefreshPolicy.bump_version()
+
+    def _change_by_query(self, url_type):
+        """change watched state of all videos of channel or playlist"""
         self._add_pipeline()
         path = f"ta_video/_update_by_query?pipeline=watch_{self.youtube_id}"
         data = self._build_update_data(url_type)
-        _, _ = ElasticWrap(path).post(data)
+        _, _ = ElasticWrap(path).post(data, refresh=True)
         self._delete_pipeline()
 
     def _dedect_type(self):
@@ -49,7 +54,7 @@ class WatchState:
                 }
             }
         }
-        response, status_code = ElasticWrap(path).post(data=data)
+        response, status_code = ElasticWrap(path).post(data=data, refresh=True)
         if status_code != 200:
             print(response)
             raise ValueError("failed to mark video as watched")
@@ -14,6 +14,7 @@ from home.src.download.yt_dlp_base import YtWrap
 from home.src.es.connect import ElasticWrap, IndexPaginate
 from home.src.index.generic import YouTubeItem
 from home.src.index.playlist import YoutubePlaylist
+from home.src.ta.ta_redis import KnownIds
 
 
 class YoutubeChannel(YouTubeItem):
@@ -26,6 +27,8 @@ class YoutubeChannel(YouTubeItem):
         "extract_flat": True,
         "allow_playlist_files": True,
     }
+    # subscription scan state, not synced to videos
+    SCAN_FIELDS = ["channel_uploads", "channel_scan_due"]
 
     def __init__(self, youtube_id, task=False):
         super().__init__(youtube_id)
@@ -160,11 +163,19 @@ class YoutubeChannel(YouTubeItem):
         )
         ThumbManager(self.youtube_id, item_type="channel").download(urls)
 
+    def get_video_channel(self):
+        """channel dict as stored in videos"""
+        return {
+            key: value
+            for key, value in self.json_data.items()
+            if key not in self.SCAN_FIELDS
+        }
+
     def sync_to_videos(self):
         """sync new channel_dict to all videos of channel"""
         # add ingest pipeline
         processors = []
-        for field, value in self.json_data.items():
+        for field, value in self.get_video_channel().items():
             line = {"set": {"field": "channel." + field, "value": value}}
             processors.append(line)
         data = {"description": self.youtube_id, "processors": processors}
@@ -191,6 +202,7 @@ class YoutubeChannel(YouTubeItem):
             }
         }
         _, _ = ElasticWrap("ta_video/_delete_by_query").post(data)
+        KnownIds().invalidate()
 
     def delete_es_comments(self):
         """delete all comments from this channel"""
@@ -271,7 +283,7 @@ class YoutubeChannel(YouTubeItem):
         if not playlist.json_data:
             return
 
-        entries = playlist.json_data["playlist_entries"]
+        entries = playlist.get_members()
         downloaded = [i for i in entries if i["downloaded"]]
         if not downloaded:
             return
@@ -283,12 +295,7 @@ class YoutubeChannel(YouTubeItem):
     @staticmethod
     def get_all_video_ids():
         """match all playlists with videos"""
-        handler = queue.PendingList()
-        handler.get_download()
-        handler.get_indexed()
-        all_youtube_ids = [i["youtube_id"] for i in handler.all_videos]
-
-        return all_youtube_ids
+        return queue.PendingIndex.get_indexed_ids()
 
     def get_channel_videos(self):
         """get all videos from channel"""
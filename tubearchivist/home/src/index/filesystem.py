@@ -49,8 +49,8 @@ class Scanner:
             self.task.send_progress(["Get all videos indexed."])
 
         data = {"query": {"match_all": {}}, "_source": ["youtube_id"]}
-        response = IndexPaginate("ta_video", data).get_results()
-        return {i["youtube_id"] for i in response}
+        paginate = IndexPaginate("ta_video", data, size=2000, slices=4)
+        return {i["youtube_id"] for i in paginate.iter_hits()}
 
     def apply(self) -> None:
         """apply all changes"""
@@ -6,7 +6,7 @@ functionality:
 import math
 
 from home.src.download.yt_dlp_base import YtWrap
-from home.src.es.connect import ElasticWrap
+from home.src.es.connect import ElasticWrap, RefreshPolicy
 from home.src.ta.config import AppConfig
 from home.src.ta.ta_redis import RedisArchivist
 
@@ -29,6 +29,7 @@ class YouTubeItem:
         self.app_conf = self.config["application"]
         self.youtube_meta = False
         self.json_data = False
+        self.info_cache = False
 
     def build_yt_url(self):
         """build youtube url"""
@@ -37,14 +38,10 @@ class YouTubeItem:
     def get_from_youtube(self):
         """use yt-dlp to get meta data from youtube"""
         print(f"{self.youtube_id}: get metadata from youtube")
-        obs_request = self.yt_obs.copy()
-        if self.config["downloads"]["extractor_lang"]:
-            langs = self.config["downloads"]["extractor_lang"]
-            langs_list = [i.strip() for i in langs.split(",")]
-            obs_request["extractor_args"] = {"youtube": {"lang": langs_list}}
-
         url = self.build_yt_url()
-        self.youtube_meta = YtWrap(obs_request, self.config).extract(url)
+        self.youtube_meta = YtWrap(self.yt_obs, self.config).extract(
+            url, cache=self.info_cache
+        )
 
     def get_from_es(self):
         """get indexed data from elastic search"""
@@ -56,6 +53,7 @@ class YouTubeItem:
     def upload_to_es(self):
         """add json_data to elastic"""
         _, _ = ElasticWrap(self.es_path).put(self.json_data, refresh=True)
+        RefreshPolicy.bump_version()
 
     def deactivate(self):
         """deactivate document in es"""
@@ -65,16 +63,18 @@ class YouTubeItem:
             "ta_channel": "channel_active",
             "ta_playlist": "playlist_active",
         }
-        path = f"{self.index_name}/_update/{self.youtube_id}?refresh=true"
+        path = f"{self.index_name}/_update/{self.youtube_id}"
         data = {
             "script": f"ctx._source.{key_match.get(self.index_name)} = false"
         }
-        _, _ = ElasticWrap(path).post(data)
+        _, _ = ElasticWrap(path).post(data, refresh=True)
+        RefreshPolicy.bump_version()
 
     def del_in_es(self):
         """delete item from elastic search"""
         print(f"{self.youtube_id}: delete from es")
         _, _ = ElasticWrap(self.es_path).delete(refresh=True)
+        RefreshPolicy.bump_version()
 
 
 class Pagination:
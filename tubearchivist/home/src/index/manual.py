@@ -8,14 +8,13 @@ Functionality:
 import json
 import os
 import re
-import shutil
 import subprocess
 
 from home.src.download.thumbnails import ThumbManager
 from home.src.index.comments import CommentList
 from home.src.index.video import YoutubeVideo
 from home.src.ta.config import AppConfig
-from home.src.ta.helper import ignore_filelist
+from home.src.ta.helper import ignore_filelist, move_file
 from PIL import Image
 from yt_dlp.utils import ISO639Utils
 
@@ -414,7 +413,7 @@ class ManualImport:
             old_path = self.current_video["thumb"]
             thumbs = ThumbManager(video_id)
             new_path = thumbs.vid_thumb_path(absolute=True, create_folder=True)
-            shutil.move(old_path, new_path, copy_function=shutil.copyfile)
+            move_file(old_path, new_path)
         else:
             url = video.json_data["vid_thumb_url"]
             ThumbManager(video_id).download_video_thumb(url)
@@ -447,7 +446,7 @@ class ManualImport:
 
         old_path = self.current_video["media"]
         new_path = os.path.join(channel_folder, file)
-        shutil.move(old_path, new_path, copy_function=shutil.copyfile)
+        move_file(old_path, new_path)
         if host_uid and host_gid:
             os.chown(new_path, host_uid, host_gid)
 
@@ -455,7 +454,7 @@ class ManualImport:
         for old_path in self.current_video["subtitle"]:
             lang = old_path.split(".")[-2]
             new_path = f"{base_name}.{lang}.vtt"
-            shutil.move(old_path, new_path, copy_function=shutil.copyfile)
+            move_file(old_path, new_path)
 
     def _cleanup(self, json_data):
         """cleanup leftover files"""
@@ -2,15 +2,17 @@
 functionality:
 - get metadata from youtube for a playlist
 - index and update in es
+- store playlist entries as single documents
 """
 
-import json
 from datetime import datetime
 
 from home.src.download.thumbnails import ThumbManager
-from home.src.es.connect import ElasticWrap
+from home.src.es.bulk import BulkWriter
+from home.src.es.connect import ElasticWrap, MultiSearch
 from home.src.index.generic import YouTubeItem
 from home.src.index.video import YoutubeVideo
+from home.src.ta.reconcile import Reconcile
 
 
 class YoutubePlaylist(YouTubeItem):
@@ -28,7 +30,9 @@ class YoutubePlaylist(YouTubeItem):
         super().__init__(youtube_id)
         self.all_members = False
         self.nav = False
-        self.all_youtube_ids = []
+        self.all_youtube_ids = set()
+        self.entries = PlaylistEntries(youtube_id)
+        self.changes = False
 
     def build_json(self, scrape=False):
         """collection to create json_data"""
@@ -46,7 +50,6 @@ class YoutubePlaylist(YouTubeItem):
 
             self.process_youtube_meta()
             self.get_entries()
-            self.json_data["playlist_entries"] = self.all_members
             self.json_data["playlist_subscribed"] = subscribed
 
     def process_youtube_meta(self):
@@ -74,11 +77,9 @@ class YoutubePlaylist(YouTubeItem):
             # implement playlist end
             print(playlistend)
         all_members = []
+        remote_ids = {i["id"] for i in self.youtube_meta["entries"]}
+        changes = Reconcile(self.all_youtube_ids, remote_ids).diff(full=False)
         for idx, entry in enumerate(self.youtube_meta["entries"]):
-            if self.all_youtube_ids:
-                downloaded = entry["id"] in self.all_youtube_ids
-            else:
-                downloaded = False
             if not entry["channel"]:
                 continue
             to_append = {
@@ -86,46 +87,90 @@ class YoutubePlaylist(YouTubeItem):
                 "title": entry["title"],
                 "uploader": entry["channel"],
                 "idx": idx,
-                "downloaded": downloaded,
+                "downloaded": entry["id"] in changes.matched,
             }
             all_members.append(to_append)
 
         self.all_members = all_members
 
+    def get_members(self):
+        """get entries from youtube if built, else from index"""
+        if self.all_members is False:
+            self.all_members = self.entries.get()
+
+        return self.all_members
+
+    def upload_to_es(self):
+        """add playlist to es, sync entries if built from youtube"""
+        super().upload_to_es()
+        if self.all_members is not False:
+            self.changes = self.entries.write(self.all_members)
+
+    def get_changed_downloaded(self):
+        """downloaded entries added or changed by last upload"""
+        if not self.changes:
+            return []
+
+        changed = set(self.changes.missing_local)
+        changed.update(i[0] for i in self.changes.changed)
+
+        return [
+            i["youtube_id"]
+            for i in self.get_members()
+            if i["downloaded"] and self.entries.entry_id(i["idx"]) in changed
+        ]
+
     def get_playlist_art(self):
         """download artwork of playlist"""
         url = self.json_data["playlist_thumbnail"]
         ThumbManager(self.youtube_id, item_type="playlist").download(url)
 
-    def add_vids_to_playlist(self):
-        """sync the playlist id to videos"""
+    def add_vids_to_playlist(self, youtube_ids=None):
+        """sync the playlist id and position to videos,
+        all entries or youtube_ids"""
+        # first position of videos in playlist more than once
+        members = reversed(self.get_members())
+        all_idx = {i["youtube_id"]: i["idx"] for i in members}
+        if youtube_ids is None:
+            youtube_ids = list(all_idx)
+
         script = (
-            'if (!ctx._source.containsKey("playlist")) '
-            + "{ctx._source.playlist = [params.playlist]} "
-            + "else if (!ctx._source.playlist.contains(params.playlist)) "
-            + "{ctx._source.playlist.add(params.playlist)} "
-            + "else {ctx.op = 'none'}"
+            "boolean changed = false; "
+            + "if (ctx._source.playlist == null) "
+            + "{ctx._source.playlist = []} "
+            + "if (!ctx._source.playlist.contains(params.playlist)) "
+            + "{ctx._source.playlist.add(params.playlist); changed = true} "
+            + "if (ctx._source.playlist_position == null) "
+            + "{ctx._source.playlist_position = []} "
+            + "def current = null; "
+            + "for (def item : ctx._source.playlist_position) "
+            + "{if (item.playlist_id == params.playlist) {current = item}} "
+            + "if (current == null) {ctx._source.playlist_position.add("
+            + "['playlist_id': params.playlist, 'idx': params.idx]); "
+            + "changed = true} "
+            + "else if (current.idx != params.idx) "
+            + "{current.idx = params.idx; changed = true} "
+            + "if (!changed) {ctx.op = 'none'}"
         )
 
-        bulk_list = []
-        for entry in self.json_data["playlist_entries"]:
-            video_id = entry["youtube_id"]
-            action = {"update": {"_id": video_id, "_index": "ta_video"}}
-            source = {
-                "script": {
-                    "source": script,
-                    "lang": "painless",
-                    "params": {"playlist": self.youtube_id},
-                }
-            }
-            bulk_list.append(json.dumps(action))
-            bulk_list.append(json.dumps(source))
+        # not downloaded entries are missing in ta_video
+        with BulkWriter(ignore_status=(404,)) as bulk:
+            for video_id in youtube_ids:
+                if video_id not in all_idx:
+                    continue
 
-        # add last newline
-        bulk_list.append("\n")
-        query_str = "\n".join(bulk_list)
-
-        ElasticWrap("_bulk").post(query_str, ndjson=True)
+                action = {"update": {"_id": video_id, "_index": "ta_video"}}
+                source = {
+                    "script": {
+                        "source": script,
+                        "lang": "painless",
+                        "params": {
+                            "playlist": self.youtube_id,
+                            "idx": all_idx[video_id],
+                        },
+                    }
+                }
+                bulk.add(action, source)
 
     def update_playlist(self):
         """update metadata for playlist with data from YouTube"""
@@ -142,31 +187,22 @@ class YoutubePlaylist(YouTubeItem):
 
     def build_nav(self, youtube_id):
         """find next and previous in playlist of a given youtube_id"""
-        all_entries_available = self.json_data["playlist_entries"]
-        all_entries = [i for i in all_entries_available if i["downloaded"]]
-        current = [i for i in all_entries if i["youtube_id"] == youtube_id]
+        current, previous_item, next_item = self.entries.get_nav(youtube_id)
         # stop if not found or playlist of 1
-        if not current or not len(all_entries) > 1:
+        if not current or not (previous_item or next_item):
             return
 
-        current_idx = all_entries.index(current[0])
-        if current_idx == 0:
-            previous_item = False
-        else:
-            previous_item = all_entries[current_idx - 1]
+        if previous_item:
             prev_id = previous_item["youtube_id"]
             previous_item["vid_thumb"] = ThumbManager(prev_id).vid_thumb_path()
 
-        if current_idx == len(all_entries) - 1:
-            next_item = False
-        else:
-            next_item = all_entries[current_idx + 1]
+        if next_item:
             next_id = next_item["youtube_id"]
             next_item["vid_thumb"] = ThumbManager(next_id).vid_thumb_path()
 
         self.nav = {
             "playlist_meta": {
-                "current_idx": current[0]["idx"],
+                "current_idx": current["idx"],
                 "playlist_id": self.youtube_id,
                 "playlist_name": self.json_data["playlist_name"],
                 "playlist_channel": self.json_data["playlist_channel"],
@@ -180,7 +216,10 @@ class YoutubePlaylist(YouTubeItem):
         """delete metadata for playlist"""
         script = (
             "ctx._source.playlist.removeAll("
-            + "Collections.singleton(params.playlist)) "
+            + "Collections.singleton(params.playlist)); "
+            + "if (ctx._source.playlist_position != null) "
+            + "{ctx._source.playlist_position.removeIf("
+            + "item -> item.playlist_id == params.playlist)}"
         )
         data = {
             "query": {
@@ -193,18 +232,161 @@ class YoutubePlaylist(YouTubeItem):
             },
         }
         _, _ = ElasticWrap("ta_video/_update_by_query").post(data)
+        self.entries.delete()
         self.del_in_es()
 
     def delete_videos_playlist(self):
         """delete playlist with all videos"""
         print(f"{self.youtube_id}: delete playlist")
-        self.get_from_es()
-        all_youtube_id = [
-            i["youtube_id"]
-            for i in self.json_data["playlist_entries"]
-            if i["downloaded"]
-        ]
-        for youtube_id in all_youtube_id:
-            YoutubeVideo(youtube_id).delete_media_file()
+        all_downloaded = self.entries.get(downloaded_only=True)
+        for entry in all_downloaded:
+            YoutubeVideo(entry["youtube_id"]).delete_media_file()
 
         self.delete_metadata()
+
+
+class PlaylistEntries:
+    """entries of a playlist as single documents in ta_playlist_entry,
+    keyed by position to keep videos added more than once"""
+
+    INDEX = "ta_playlist_entry"
+    FIELDS = ["youtube_id", "title", "uploader", "idx", "downloaded"]
+    MAX_ENTRIES = 10000
+
+    def __init__(self, playlist_id):
+        self.playlist_id = playlist_id
+
+    def entry_id(self, idx):
+        """build document id of entry at idx"""
+        return f"{self.playlist_id}-{idx}"
+
+    def get_query(self, downloaded_only=False):
+        """build query for entries of playlist"""
+        must = [{"term": {"playlist_id": {"value": self.playlist_id}}}]
+        if downloaded_only:
+            must.append({"term": {"downloaded": {"value": True}}})
+
+        return {"bool": {"must": must}}
+
+    def get(self, downloaded_only=False):
+        """get entries ordered by idx"""
+        return [i["_source"] for i in self._search(downloaded_only)]
+
+    def _search(self, downloaded_only=False):
+        """get entry hits ordered by idx, youtube caps playlists at 5000"""
+        data = {
+            "query": self.get_query(downloaded_only),
+            "sort": [{"idx": {"order": "asc"}}],
+            "_source": self.FIELDS,
+            "size": self.MAX_ENTRIES,
+        }
+        response, _ = ElasticWrap(f"{self.INDEX}/_search").get(data=data)
+        return response["hits"]["hits"]
+
+    def count(self):
+        """count all entries of playlist"""
+        path = f"{self.INDEX}/_count"
+        response, _ = ElasticWrap(path).get(data={"query": self.get_query()})
+        return response.get("count", 0)
+
+    def write(self, entries):
+        """sync entries, write new and changed, delete removed,
+        return change set by entry_id"""
+        reconcile = Reconcile(
+            ((i["_id"], i["_source"]) for i in self._search()),
+            (
+                (
+                    self.entry_id(i["idx"]),
+                    {key: i.get(key) for key in self.FIELDS},
+                )
+                for i in entries
+            ),
+        )
+        changes = reconcile.diff()
+        to_write = changes.missing_local + [i[0] for i in changes.changed]
+        with BulkWriter(refresh=True) as bulk:
+            for entry_id in to_write:
+                action = {"update": {"_index": self.INDEX, "_id": entry_id}}
+                doc = {"playlist_id": self.playlist_id}
+                doc.update(reconcile.remote[entry_id])
+                bulk.add(action, {"doc": doc, "doc_as_upsert": True})
+
+            for entry_id in changes.missing_remote:
+                bulk.add({"delete": {"_index": self.INDEX, "_id": entry_id}})
+
+        print(f"{self.playlist_id}: entries {changes.summary()}")
+
+        return changes
+
+    def get_nav(self, youtube_id):
+        """get first entry of youtube_id with previous and next downloaded"""
+        query = self.get_query()
+        query["bool"]["must"].append(
+            {"term": {"youtube_id": {"value": youtube_id}}}
+        )
+        data = {
+            "query": query,
+            "sort": [{"idx": {"order": "asc"}}],
+            "_source": self.FIELDS,
+            "size": 1,
+        }
+        response, _ = ElasticWrap(f"{self.INDEX}/_search").get(data=data)
+        hits = response.get("hits", {}).get("hits")
+        current = hits[0]["_source"] if hits else False
+        if not current or not current["downloaded"]:
+            return False, False, False
+
+        search = MultiSearch()
+        search.add(self.INDEX, self._get_neighbour(current["idx"], "lt"))
+        search.add(self.INDEX, self._get_neighbour(current["idx"], "gt"))
+        previous_item, next_item = [
+            i["hits"]["hits"][0]["_source"] if i["hits"]["hits"] else False
+            for i in search.run()
+        ]
+
+        return current, previous_item, next_item
+
+    def _get_neighbour(self, idx, direction):
+        """build query for closest downloaded entry before or after idx"""
+        query = self.get_query(downloaded_only=True)
+        query["bool"]["must"].append({"range": {"idx": {direction: idx}}})
+        order = "desc" if direction == "lt" else "asc"
+        return {
+            "query": query,
+            "sort": [{"idx": {"order": order}}],
+            "_source": self.FIELDS,
+            "size": 1,
+        }
+
+    def delete(self):
+        """delete all entries of playlist"""
+        path = f"{self.INDEX}/_delete_by_query"
+        data = {"query": self.get_query()}
+        _, _ = ElasticWrap(path).post(data=data, refresh=True)
+
+    @classmethod
+    def mark_video(cls, youtube_id, playlist_ids, downloaded):
+        """set downloaded state of video in all its playlists"""
+        query = {
+            "bool": {
+                "must": [
+                    {"terms": {"playlist_id": playlist_ids}},
+                    {"term": {"youtube_id": {"value": youtube_id}}},
+                ]
+            }
+        }
+        script = (
+            "if (ctx._source.downloaded == params.downloaded) "
+            + "{ctx.op = 'none'} "
+            + "else {ctx._source.downloaded = params.downloaded}"
+        )
+        data = {
+            "query": query,
+            "script": {
+                "source": script,
+                "lang": "painless",
+                "params": {"downloaded": downloaded},
+            },
+        }
+        path = f"{cls.INDEX}/_update_by_query"
+        _, _ = ElasticWrap(path).post(data=data, refresh=True)
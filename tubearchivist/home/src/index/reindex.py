@@ -4,21 +4,22 @@ functionality:
 - index and update in es
 """
 
-import json
 import os
 from datetime import datetime
 from time import sleep
 
-from home.src.download.queue import PendingList
+from home.src.download.queue import PendingIndex
 from home.src.download.subscriptions import ChannelSubscription
 from home.src.download.thumbnails import ThumbManager
 from home.src.download.yt_dlp_base import CookieHandler
+from home.src.es.bulk import BulkWriter
 from home.src.es.connect import ElasticWrap, IndexPaginate
 from home.src.index.channel import YoutubeChannel
 from home.src.index.comments import Comments
 from home.src.index.playlist import YoutubePlaylist
 from home.src.index.video import YoutubeVideo
 from home.src.ta.config import AppConfig
+from home.src.ta.reconcile import Reconcile
 from home.src.ta.ta_redis import RedisQueue
 
 
@@ -309,6 +310,9 @@ class Reindex(ReindexBase):
         video.json_data["channel"] = es_meta.get("channel")
         if es_meta.get("playlist"):
             video.json_data["playlist"] = es_meta.get("playlist")
+            video.json_data["playlist_position"] = es_meta.get(
+                "playlist_position"
+            )
 
         video.upload_to_es()
         if es_meta.get("media_url") != video.json_data["media_url"]:
@@ -357,6 +361,10 @@ class Reindex(ReindexBase):
         if overwrites:
             channel.json_data["channel_overwrites"] = overwrites
 
+        for key in channel.SCAN_FIELDS:
+            if key in es_meta:
+                channel.json_data[key] = es_meta[key]
+
         channel.upload_to_es()
         ChannelFullScan(channel_id).scan()
         self.processed["channels"] += 1
@@ -375,6 +383,8 @@ class Reindex(ReindexBase):
 
         playlist.json_data["playlist_subscribed"] = subscribed
         playlist.upload_to_es()
+        # sync positions of new and moved entries to videos
+        playlist.add_vids_to_playlist(playlist.get_changed_downloaded())
         self.processed["playlists"] += 1
         return
 
@@ -383,10 +393,7 @@ class Reindex(ReindexBase):
         if self.all_indexed_ids:
             return
 
-        handler = PendingList()
-        handler.get_download()
-        handler.get_indexed()
-        self.all_indexed_ids = [i["youtube_id"] for i in handler.all_videos]
+        self.all_indexed_ids = PendingIndex.get_indexed_ids()
 
     def cookie_is_valid(self):
         """return true if cookie is enabled and valid"""
@@ -499,22 +506,17 @@ class ChannelFullScan:
         print(f"{self.channel_id}: start full scan")
         all_local_videos = self._get_all_local()
         all_remote_videos = self._get_all_remote()
-        self.to_update = []
-        for video in all_local_videos:
-            video_id = video["youtube_id"]
-            remote_match = [i for i in all_remote_videos if i[0] == video_id]
-            if not remote_match:
-                print(f"{video_id}: no remote match found")
-                continue
-
-            expected_type = remote_match[0][-1]
-            if video["vid_type"] != expected_type:
-                self.to_update.append(
-                    {
-                        "video_id": video_id,
-                        "vid_type": expected_type,
-                    }
-                )
+        changes = Reconcile(
+            ((i["youtube_id"], i["vid_type"]) for i in all_local_videos),
+            ((i[0], i[-1]) for i in all_remote_videos),
+        ).diff()
+        for video_id in changes.missing_remote:
+            print(f"{video_id}: no remote match found")
+
+        self.to_update = [
+            {"video_id": video_id, "vid_type": expected_type}
+            for video_id, _, expected_type in changes.changed
+        ]
 
         self.update()
 
@@ -541,15 +543,13 @@ class ChannelFullScan:
             return
 
         print(f"{self.channel_id}: fixing {len(self.to_update)} videos")
-        bulk_list = []
-        for video in self.to_update:
-            action = {
-                "update": {"_id": video.get("video_id"), "_index": "ta_video"}
-            }
-            source = {"doc": {"vid_type": video.get("vid_type")}}
-            bulk_list.append(json.dumps(action))
-            bulk_list.append(json.dumps(source))
-        # add last newline
-        bulk_list.append("\n")
-        data = "\n".join(bulk_list)
-        _, _ = ElasticWrap("_bulk").post(data=data, ndjson=True)
+        with BulkWriter() as bulk:
+            for video in self.to_update:
+                action = {
+                    "update": {
+                        "_id": video.get("video_id"),
+                        "_index": "ta_video",
+                    }
+                }
+                source = {"doc": {"vid_type": video.get("vid_type")}}
+                bulk.add(action, source)
@@ -10,8 +10,10 @@ import os
 from datetime import datetime
 
 import requests
+from home.src.es.bulk import BulkWriter
 from home.src.es.connect import ElasticWrap
 from home.src.ta.helper import requests_headers
+from home.src.ta.rate_limit import BandwidthLimiter
 
 
 class YoutubeSubtitle:
@@ -114,6 +116,7 @@ class YoutubeSubtitle:
     def download_subtitles(self, relevant_subtitles):
         """download subtitle files to archive"""
         videos_base = self.video.config["application"]["videos"]
+        limiter = BandwidthLimiter(self.video.config)
         indexed = []
         for subtitle in relevant_subtitles:
             dest_path = os.path.join(videos_base, subtitle["media_url"])
@@ -127,6 +130,8 @@ class YoutubeSubtitle:
                 print(response.text)
                 continue
 
+            limiter.consume(len(response.content))
+
             parser = SubtitleParser(response.text, lang, source)
             parser.process()
             if not parser.all_cues:
@@ -135,8 +140,8 @@ class YoutubeSubtitle:
             subtitle_str = parser.get_subtitle_str()
             self._write_subtitle_file(dest_path, subtitle_str)
             if self.video.config["downloads"]["subtitle_index"]:
-                query_str = parser.create_bulk_import(self.video, source)
-                self._index_subtitle(query_str)
+                with BulkWriter() as bulk:
+                    parser.create_bulk_import(self.video, source, bulk)
 
             indexed.append(subtitle)
 
@@ -154,11 +159,6 @@ class YoutubeSubtitle:
         if host_uid and host_gid:
             os.chown(dest_path, host_uid, host_gid)
 
-    @staticmethod
-    def _index_subtitle(query_str):
-        """send subtitle to es for indexing"""
-        _, _ = ElasticWrap("_bulk").post(data=query_str, ndjson=True)
-
     def delete(self, subtitles=False):
         """delete subtitles from index and filesystem"""
         youtube_id = self.video.youtube_id
@@ -179,9 +179,9 @@ class YoutubeSubtitle:
             except FileNotFoundError:
                 print(f"{youtube_id}: {file_path} failed to delete")
         # delete from index
-        path = "ta_subtitle/_delete_by_query?refresh=true"
+        path = "ta_subtitle/_delete_by_query"
         data = {"query": {"term": {"youtube_id": {"value": youtube_id}}}}
-        _, _ = ElasticWrap(path).post(data=data)
+        _, _ = ElasticWrap(path).post(data=data, refresh=True)
 
 
 class SubtitleParser:
@@ -269,21 +269,13 @@ class SubtitleParser:
 
         return subtitle_str
 
-    def create_bulk_import(self, video, source):
-        """subtitle lines for es import"""
+    def create_bulk_import(self, video, source, bulk):
+        """add subtitle lines to bulk writer for es import"""
         documents = self._create_documents(video, source)
-        bulk_list = []
-
         for document in documents:
             document_id = document.get("subtitle_fragment_id")
             action = {"index": {"_index": "ta_subtitle", "_id": document_id}}
-            bulk_list.append(json.dumps(action))
-            bulk_list.append(json.dumps(document))
-
-        bulk_list.append("\n")
-        query_str = "\n".join(bulk_list)
-
-        return query_str
+            bulk.add(action, document)
 
     def _create_documents(self, video, source):
         """process documents"""
@@ -9,6 +9,7 @@ from datetime import datetime
 
 import requests
 from django.conf import settings
+from home.src.download.yt_dlp_base import InfoCache
 from home.src.es.connect import ElasticWrap
 from home.src.index import channel as ta_channel
 from home.src.index import comments as ta_comments
@@ -21,7 +22,7 @@ from home.src.index.video_streams import (
     MediaStreamExtractor,
 )
 from home.src.ta.helper import randomizor
-from home.src.ta.ta_redis import RedisArchivist
+from home.src.ta.ta_redis import KnownIds, RedisArchivist
 from ryd_client import ryd_client
 
 
@@ -209,7 +210,7 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
         """add channel dict to video json_data"""
         channel = ta_channel.YoutubeChannel(self.channel_id)
         channel.build_json(upload=True, fallback=self.youtube_meta)
-        self.json_data.update({"channel": channel.json_data})
+        self.json_data.update({"channel": channel.get_video_channel()})
 
     def _add_stats(self):
         """add stats dicst to json_data"""
@@ -281,6 +282,11 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
             self.json_data["youtube_id"] + ".mp4",
         )
 
+    def upload_to_es(self):
+        """add json_data to elastic and known video ids"""
+        super().upload_to_es()
+        KnownIds().add("indexed", [self.youtube_id])
+
     def delete_media_file(self):
         """delete video file, meta data"""
         print(f"{self.youtube_id}: delete video")
@@ -298,6 +304,7 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
 
         self.del_in_playlists()
         self.del_in_es()
+        KnownIds().remove([self.youtube_id], states=["indexed"])
         self.delete_subtitles()
         self.delete_comments()
 
@@ -309,15 +316,10 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
 
         for playlist_id in all_playlists:
             print(f"{playlist_id}: delete video {self.youtube_id}")
-            playlist = ta_playlist.YoutubePlaylist(playlist_id)
-            playlist.get_from_es()
-            entries = playlist.json_data["playlist_entries"]
-            for idx, entry in enumerate(entries):
-                if entry["youtube_id"] == self.youtube_id:
-                    playlist.json_data["playlist_entries"][idx].update(
-                        {"downloaded": False}
-                    )
-            playlist.upload_to_es()
+
+        ta_playlist.PlaylistEntries.mark_video(
+            self.youtube_id, all_playlists, downloaded=False
+        )
 
     def delete_subtitles(self, subtitles=False):
         """delete indexed subtitles"""
@@ -402,7 +404,10 @@ def index_new_video(
     video = YoutubeVideo(
         youtube_id, video_overwrites=video_overwrites, video_type=video_type
     )
+    # reuse info json from download
+    video.info_cache = True
     video.build_json()
+    InfoCache.delete(youtube_id, video.config)
     if not video.json_data:
         raise ValueError("failed to get metadata for " + youtube_id)
 
@@ -7,8 +7,10 @@ Functionality:
 import json
 import os
 import re
+import threading
+from copy import deepcopy
 from random import randint
-from time import sleep
+from time import sleep, time
 
 import requests
 from celery.schedules import crontab
@@ -25,26 +27,26 @@ class AppConfig:
         self.colors = self.get_colors()
 
     def get_config(self):
-        """get config from default file or redis if changed"""
-        config = self.get_config_redis()
-        if not config:
-            config = self.get_config_file()
+        """get shared read only config from process cache,
+        copy with user overwrites on top if user_id"""
+        config = ConfigCache.get()
 
         if self.user_id:
+            config = deepcopy(config)
             key = f"{self.user_id}:page_size"
             page_size = RedisArchivist().get_message(key)["status"]
             if page_size:
                 config["archive"]["page_size"] = page_size
 
-        config["application"].update(self.get_config_env())
         return config
 
-    def get_config_file(self):
+    @staticmethod
+    def get_config_file():
         """read the defaults from config.json"""
         with open("home/config.json", "r", encoding="utf-8") as f:
             config_file = json.load(f)
 
-        config_file["application"].update(self.get_config_env())
+        config_file["application"].update(AppConfig.get_config_env())
 
         return config_file
 
@@ -84,6 +86,7 @@ class AppConfig:
 
     def update_config(self, form_post):
         """update config values from settings form"""
+        self.config = deepcopy(self.config)
         updated = []
         for key, value in form_post.items():
             if not value and not isinstance(value, int):
@@ -101,6 +104,7 @@ class AppConfig:
             updated.append((config_value, to_write))
 
         RedisArchivist().set_message("config", self.config, save=True)
+        ConfigCache.invalidate()
         return updated
 
     @staticmethod
@@ -122,8 +126,9 @@ class AppConfig:
             colors = col_dict["status"]
 
         if not colors:
-            colors = self.config["application"]["colors"]
+            return self.config["application"]["colors"]
 
+        # config is a copy if user_id
         self.config["application"]["colors"] = colors
         return colors
 
@@ -143,9 +148,10 @@ class AppConfig:
 
         # check for customizations
         if not redis_config:
-            config = self.get_config()
+            config = deepcopy(self.get_config())
             config["scheduler"]["version_check"] = self._build_rand_daily()
             RedisArchivist().set_message("config", config)
+            ConfigCache.invalidate()
             return False
 
         needs_update = False
@@ -168,10 +174,70 @@ class AppConfig:
 
         if needs_update:
             RedisArchivist().set_message("config", redis_config)
+            ConfigCache.invalidate()
 
         return needs_update
 
 
+class ConfigCache:
+    """process local snapshot of the application config
+    version counter in redis is bumped on every config write,
+    checked at most every CHECK_INTERVAL seconds to reload when outdated,
+    returned dict is shared, treat as read only
+    """
+
+    KEY_VERSION: str = "config:version"
+    CHECK_INTERVAL: int = 5
+
+    _lock = threading.Lock()
+    _config: dict | bool = False
+    _version: int | bool = False
+    _checked: float = 0
+
+    @classmethod
+    def get(cls):
+        """get shared cached config, reload if outdated"""
+        config = cls._config
+        if config and time() - cls._checked < cls.CHECK_INTERVAL:
+            return config
+
+        version = cls._get_version()
+        with cls._lock:
+            if not cls._config or cls._version != version:
+                # stamp with version read before load, a write during
+                # load bumps the version and triggers reload next check
+                cls._config = cls._load()
+                cls._version = version
+
+            cls._checked = time()
+            return cls._config
+
+    @classmethod
+    def _get_version(cls):
+        """read current config version from redis"""
+        key = RedisArchivist.NAME_SPACE + cls.KEY_VERSION
+        version = RedisArchivist().conn.execute_command("GET", key)
+        return int(version or 0)
+
+    @staticmethod
+    def _load():
+        """read config from redis, defaults from file as fallback"""
+        config = AppConfig.get_config_redis()
+        if not config:
+            config = AppConfig.get_config_file()
+
+        config["application"].update(AppConfig.get_config_env())
+        return config
+
+    @classmethod
+    def invalidate(cls):
+        """reload here now, bump version to reload in all processes"""
+        key = RedisArchivist.NAME_SPACE + cls.KEY_VERSION
+        with cls._lock:
+            cls._config = False
+            RedisArchivist().conn.execute_command("INCR", key)
+
+
 class ScheduleBuilder:
     """build schedule dicts for beat"""
 
@@ -184,6 +250,7 @@ class ScheduleBuilder:
         "version_check": "0 11 *",
     }
     CONFIG = ["check_reindex_days", "run_backup_rotate"]
+    KWARGS = {"update_subscribed": {"due_only": True}}
     NOTIFY = [
         "update_subscribed_notify",
         "download_pending_notify",
@@ -197,7 +264,7 @@ class ScheduleBuilder:
     def update_schedule_conf(self, form_post):
         """process form post"""
         print("processing form, restart container for changes to take effect")
-        redis_config = self.config
+        redis_config = deepcopy(self.config)
         for key, value in form_post.items():
             if key in self.SCHEDULES and value:
                 try:
@@ -227,6 +294,7 @@ class ScheduleBuilder:
                 redis_config["scheduler"][key] = to_write
 
         RedisArchivist().set_message("config", redis_config, save=True)
+        ConfigCache.invalidate()
         mess_dict = {
             "group": "setting:schedule",
             "level": "info",
@@ -306,6 +374,7 @@ class ScheduleBuilder:
                             hour=item_conf["hour"],
                             day_of_week=item_conf["day_of_week"],
                         ),
+                        "kwargs": self.KWARGS.get(schedule_item, {}),
                     }
                 }
             )
@@ -3,14 +3,17 @@ Loose collection of helper functions
 - don't import AppConfig class here to avoid circular imports
 """
 
+import errno
 import json
 import os
 import random
 import string
 from datetime import datetime
+from time import time
 from urllib.parse import urlparse
 
 import requests
+from home.src.ta.ta_redis import ShortsCache
 
 
 def ignore_filelist(filelist: list[str]) -> list[str]:
@@ -123,6 +126,58 @@ def clear_dl_cache(config: dict) -> int:
     return len(leftover_files)
 
 
+def move_file(old_path: str, new_path: str) -> None:
+    """move file, rename on same device, copy in kernel space otherwise"""
+    try:
+        os.rename(old_path, new_path)
+        return
+    except OSError as err:
+        if err.errno != errno.EXDEV:
+            raise
+
+    start = time()
+    size = os.path.getsize(old_path)
+    with open(old_path, "rb") as src, open(new_path, "wb") as dst:
+        _copy_fd(src.fileno(), dst.fileno(), size)
+        os.fsync(dst.fileno())
+        # copied media won't be read again soon, don't keep it cached
+        os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        os.posix_fadvise(dst.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+    if os.path.getsize(new_path) != size:
+        os.remove(new_path)
+        raise OSError(f"size mismatch after copy: {old_path} to {new_path}")
+
+    os.remove(old_path)
+    duration = max(time() - start, 0.001)
+    speed = size / duration / 1024 / 1024
+    print(f"moved {old_path}: {size} bytes, {duration:.1f}s, {speed:.1f}MB/s")
+
+
+def _copy_fd(src_fd: int, dst_fd: int, size: int) -> None:
+    """copy without going through user space, fall back to sendfile"""
+    copied: int = 0
+    use_copy_range: bool = hasattr(os, "copy_file_range")
+    while copied < size:
+        count = min(size - copied, 64 * 1024 * 1024)
+        if use_copy_range:
+            try:
+                sent = os.copy_file_range(src_fd, dst_fd, count)
+            except OSError as err:
+                if err.errno not in [errno.EXDEV, errno.ENOSYS, errno.EINVAL]:
+                    raise
+
+                use_copy_range = False
+                continue
+        else:
+            sent = os.sendfile(dst_fd, src_fd, copied, count)
+
+        if not sent:
+            break
+
+        copied += sent
+
+
 def get_mapping() -> dict:
     """read index_mapping.json and get expected mapping and settings"""
     with open("home/src/es/index_mapping.json", "r", encoding="utf-8") as f:
@@ -133,12 +188,21 @@ def get_mapping() -> dict:
 
 def is_shorts(youtube_id: str) -> bool:
     """check if youtube_id is a shorts video, bot not it it's not a shorts"""
+    cache = ShortsCache()
+    cached = cache.get(youtube_id)
+    if cached is not None:
+        return cached
+
     shorts_url = f"https://www.youtube.com/shorts/{youtube_id}"
     response = requests.head(
         shorts_url, headers=requests_headers(), timeout=10
     )
+    result = response.status_code == 200
+    if response.status_code < 400:
+        # don't cache errors
+        cache.set(youtube_id, result)
 
-    return response.status_code == 200
+    return result
 
 
 def ta_host_parser(ta_host: str) -> tuple[list[str], list[str]]:
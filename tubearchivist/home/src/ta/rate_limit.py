@@ -0,0 +1,128 @@
+"""
+functionality:
+- limit rate of calls to external services
+- shared between threads of a process
+- limit global download bandwidth through redis
+"""
+
+import threading
+from datetime import datetime
+from time import monotonic, sleep
+
+from home.src.ta.ta_redis import RedisBase
+
+
+class RateLimiter:
+    """space out calls evenly, allow calls per period seconds"""
+
+    def __init__(self, calls: int, period: float | int | bool):
+        self.interval: float = period / calls if calls and period else 0
+        self.lock = threading.Lock()
+        self.next_slot: float = 0
+
+    def wait(self) -> None:
+        """block until next call is allowed"""
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+
+        if slot > now:
+            sleep(slot - now)
+
+
+class BandwidthLimiter(RedisBase):
+    """
+    global download bandwidth as token bucket in redis
+    shared by all downloads, thumbnails and subtitles of all processes
+    """
+
+    KEY: str = "bandwidth:bucket"
+    MAX_WAIT: int = 10
+    _warned: set[str] = set()
+    LUA_CONSUME: str = """
+        local time = redis.call("TIME")
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+        local rate = tonumber(ARGV[1])
+        local amount = tonumber(ARGV[2])
+        local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+        local tokens = tonumber(bucket[1]) or rate
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(rate, tokens + (now - updated) * rate) - amount
+        redis.call("HSET", KEYS[1], "tokens", tokens, "updated", now)
+        redis.call("EXPIRE", KEYS[1], 60)
+        if tokens >= 0 then
+            return "0"
+        end
+        return tostring(-tokens / rate)
+    """
+
+    def __init__(self, config: dict):
+        super().__init__()
+        self.config: dict = config
+        self.consume_script = self.conn.register_script(self.LUA_CONSUME)
+
+    def get_rate(self) -> int:
+        """get bytes per second for now, 0 for unlimited"""
+        limit_kb = self.config["downloads"]["limit_speed"] or 0
+        schedule = self.config["downloads"].get("limit_speed_schedule")
+        if schedule:
+            now = datetime.now().strftime("%H:%M")
+            for window in schedule.split(","):
+                window_limit = self._match_window(window.strip(), now)
+                if window_limit is not None:
+                    limit_kb = window_limit
+                    break
+
+        return int(limit_kb) * 1024
+
+    @staticmethod
+    def parse_window(window: str) -> tuple[str, str, int]:
+        """parse HH:MM-HH:MM=KB window, raise ValueError if invalid"""
+        span, limit = window.split("=")
+        start, end = [i.strip().zfill(5) for i in span.split("-")]
+        for time_str in [start, end]:
+            datetime.strptime(time_str, "%H:%M")
+
+        limit_kb = int(limit)
+        if limit_kb < 0:
+            raise ValueError(f"negative limit in {window}")
+
+        return start, end, limit_kb
+
+    @classmethod
+    def _match_window(cls, window: str, now: str) -> int | None:
+        """return limit of window if now matches"""
+        try:
+            start, end, limit_kb = cls.parse_window(window)
+        except ValueError:
+            if window not in cls._warned:
+                cls._warned.add(window)
+                print(f"bandwidth: ignore invalid schedule window {window}")
+
+            return None
+
+        if start <= end:
+            is_match = start <= now < end
+        else:
+            # window over midnight
+            is_match = now >= start or now < end
+
+        return limit_kb if is_match else None
+
+    def consume(self, amount: int) -> None:
+        """take amount of bytes from bucket, block while in debt"""
+        rate = self.get_rate()
+        if not rate or amount <= 0:
+            return
+
+        wait = float(
+            self.consume_script(
+                keys=[self.NAME_SPACE + self.KEY], args=[rate, amount]
+            )
+        )
+        if wait > 0:
+            sleep(min(wait, self.MAX_WAIT))
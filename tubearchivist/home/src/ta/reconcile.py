@@ -0,0 +1,83 @@
+"""
+functionality:
+- reconcile local against remote items in linear time
+- build hash indexes once, return typed change sets
+"""
+
+
+class ChangeSet:
+    """differences of local against remote items
+    - changed: (item_id, local_value, remote_value) with different values
+    - missing_local: ids only found remote
+    - missing_remote: ids only found local
+    - matched: ids found on both sides
+    """
+
+    def __init__(self):
+        self.changed: list[tuple] = []
+        self.missing_local: list[str] = []
+        self.missing_remote: list[str] = []
+        self.matched: set[str] = set()
+
+    def __bool__(self) -> bool:
+        return bool(self.changed or self.missing_local or self.missing_remote)
+
+    def summary(self) -> str:
+        """short description for logging"""
+        return (
+            f"{len(self.changed)} changed, "
+            + f"{len(self.missing_local)} missing local, "
+            + f"{len(self.missing_remote)} missing remote"
+        )
+
+
+class Reconcile:
+    """diff local against remote items by id
+    local and remote can be:
+    - dict: item_id to value to compare
+    - set: item_ids only, values are not compared
+    - iterable of (item_id, value) pairs
+    """
+
+    def __init__(self, local, remote):
+        self.local = self.build_index(local)
+        self.remote = self.build_index(remote)
+
+    @staticmethod
+    def build_index(items) -> dict | set:
+        """hash index of items, dicts and sets are used as they are"""
+        if isinstance(items, (dict, set, frozenset)):
+            return items
+
+        index = {}
+        for item_id, value in items:
+            # first occurrence wins
+            index.setdefault(item_id, value)
+
+        return index
+
+    def diff(self, full: bool = True) -> ChangeSet:
+        """build change set, full=False to skip missing_remote
+        when local is a superset like all indexed videos"""
+        changes = ChangeSet()
+        compare = all(isinstance(i, dict) for i in [self.local, self.remote])
+        for item_id in self.remote:
+            if item_id not in self.local:
+                changes.missing_local.append(item_id)
+                continue
+
+            changes.matched.add(item_id)
+            if not compare:
+                continue
+
+            local_value = self.local[item_id]
+            remote_value = self.remote[item_id]
+            if local_value != remote_value:
+                changes.changed.append((item_id, local_value, remote_value))
+
+        if full:
+            changes.missing_remote = [
+                i for i in self.local if i not in self.remote
+            ]
+
+        return changes
@@ -97,6 +97,191 @@ class RedisArchivist(RedisBase):
         return response
 
 
+class IndexVersion(RedisBase):
+    """version counter bumped on index writes to invalidate caches"""
+
+    KEY: str = "index:version"
+
+    def get(self) -> int:
+        """get current version"""
+        result = self.conn.execute_command("GET", self.NAME_SPACE + self.KEY)
+        if not result:
+            return 0
+
+        return int(result)
+
+    def bump(self) -> int:
+        """increase version after index changed"""
+        return self.conn.execute_command("INCR", self.NAME_SPACE + self.KEY)
+
+
+class KnownIds(RedisBase):
+    """sets of known video ids by state, mirror of es"""
+
+    STATES: list[str] = ["indexed", "pending", "ignore"]
+    KEY_READY: str = "known:ready"
+    BATCH: int = 1000
+
+    def _key(self, state: str) -> str:
+        """redis key for state"""
+        return f"{self.NAME_SPACE}known:{state}"
+
+    def is_ready(self) -> bool:
+        """check if sets got built from es"""
+        key: str = self.NAME_SPACE + self.KEY_READY
+        return bool(self.conn.execute_command("EXISTS", key))
+
+    def invalidate(self) -> None:
+        """mark out of sync, rebuild before next use"""
+        self.conn.execute_command("DEL", self.NAME_SPACE + self.KEY_READY)
+
+    def add(self, state: str, video_ids: list[str]) -> None:
+        """add video ids to state"""
+        if video_ids:
+            self.conn.execute_command("SADD", self._key(state), *video_ids)
+
+    def remove(self, video_ids: list[str], states: list[str]) -> None:
+        """remove video ids from states"""
+        pipeline = self.conn.pipeline(transaction=False)
+        for state in states:
+            pipeline.srem(self._key(state), *video_ids)
+
+        pipeline.execute()
+
+    def move(self, video_id: str, state: str) -> None:
+        """set new state of queued video"""
+        pipeline = self.conn.pipeline()
+        for old_state in ["pending", "ignore"]:
+            pipeline.srem(self._key(old_state), video_id)
+
+        pipeline.sadd(self._key(state), video_id)
+        pipeline.execute()
+
+    def clear_state(self, state: str) -> None:
+        """remove all video ids of state"""
+        self.conn.execute_command("DEL", self._key(state))
+
+    def members(self, state: str) -> set[str]:
+        """get all video ids of state"""
+        result = self.conn.execute_command("SMEMBERS", self._key(state))
+        return {i.decode() for i in result}
+
+    def find_unknown(self, video_ids: list[str]) -> list[str]:
+        """return video ids not in any state, keep order"""
+        unknown: list[str] = []
+        for idx in range(0, len(video_ids), self.BATCH):
+            end = idx + self.BATCH
+            batch = video_ids[idx:end]
+            pipeline = self.conn.pipeline(transaction=False)
+            for state in self.STATES:
+                pipeline.smismember(self._key(state), batch)
+
+            is_known = [any(i) for i in zip(*pipeline.execute())]
+            unknown.extend(i for i, j in zip(batch, is_known) if not j)
+
+        return unknown
+
+    def replace(self, all_ids: dict[str, set[str]]) -> None:
+        """replace all sets at once, mark as ready"""
+        pipeline = self.conn.pipeline()
+        for state in self.STATES:
+            key: str = self._key(state)
+            pipeline.delete(key)
+            video_ids = list(all_ids.get(state, []))
+            for idx in range(0, len(video_ids), self.BATCH):
+                end = idx + self.BATCH
+                pipeline.sadd(key, *video_ids[idx:end])
+
+        pipeline.set(self.NAME_SPACE + self.KEY_READY, 1)
+        pipeline.execute()
+
+
+class ShortsCache(RedisBase):
+    """cache result of shorts detection, never changes for a video"""
+
+    KEY_BASE: str = "shorts:"
+    EXPIRE: int = 60 * 60 * 24 * 180
+
+    def get(self, youtube_id: str) -> bool | None:
+        """get cached result, None if not in cache"""
+        key: str = self.NAME_SPACE + self.KEY_BASE + youtube_id
+        cached = self.conn.execute_command("GET", key)
+        if cached is None:
+            return None
+
+        return cached == b"1"
+
+    def set(self, youtube_id: str, is_shorts: bool) -> None:
+        """store result"""
+        key: str = self.NAME_SPACE + self.KEY_BASE + youtube_id
+        self.conn.set(key, int(is_shorts), ex=self.EXPIRE)
+
+
+class ScanMarkers(RedisBase):
+    """remember newest video id per channel tab and feed of last scan"""
+
+    KEY_BASE: str = "scan:channel:"
+    EXPIRE: int = 60 * 60 * 24 * 30
+
+    def get(self, channel_id: str) -> dict[str, str]:
+        """get markers of channel"""
+        key: str = self.NAME_SPACE + self.KEY_BASE + channel_id
+        markers = self.conn.hgetall(key)
+        return {k.decode(): v.decode() for k, v in markers.items()}
+
+    def set_many(self, all_markers: dict[str, dict[str, str]]) -> None:
+        """store markers by channel id, drop outdated feed marker"""
+        pipeline = self.conn.pipeline(transaction=False)
+        for channel_id, markers in all_markers.items():
+            key: str = self.NAME_SPACE + self.KEY_BASE + channel_id
+            if "feed" not in markers:
+                pipeline.hdel(key, "feed")
+
+            if not markers:
+                continue
+
+            pipeline.hset(key, mapping=markers)
+            pipeline.expire(key, self.EXPIRE)
+
+        pipeline.execute()
+
+
+class RedisLease(RedisBase):
+    """claim items exclusively across threads and processes"""
+
+    EXPIRE: int = 600
+
+    def __init__(self, name: str, owner: str):
+        super().__init__()
+        self.key_base: str = f"{self.NAME_SPACE}lease:{name}:"
+        self.owner: str = owner
+
+    def claim(self, item_id: str) -> bool:
+        """claim item, False if already claimed by another owner"""
+        result = self.conn.execute_command(
+            "SET", self.key_base + item_id, self.owner, "NX", "EX", self.EXPIRE
+        )
+        return bool(result)
+
+    def renew(self, item_ids: list[str]) -> None:
+        """extend expiry of claimed items still in progress"""
+        if not item_ids:
+            return
+
+        pipeline = self.conn.pipeline(transaction=False)
+        for item_id in item_ids:
+            pipeline.expire(self.key_base + item_id, self.EXPIRE)
+
+        pipeline.execute()
+
+    def release(self, item_id: str) -> None:
+        """release item if still owned"""
+        key: str = self.key_base + item_id
+        result = self.conn.execute_command("GET", key)
+        if result and result.decode() == self.owner:
+            self.conn.execute_command("DEL", key)
+
+
 class RedisQueue(RedisBase):
     """dynamically interact with queues in redis"""
 
@@ -7,16 +7,21 @@ Functionality:
 """
 
 import os
+import threading
+from time import time
 
 from celery import Celery, Task, shared_task
 from home.src.download.queue import PendingList
 from home.src.download.subscriptions import (
+    ChannelSubscription,
     SubscriptionHandler,
     SubscriptionScanner,
 )
 from home.src.download.thumbnails import ThumbFilesystem, ThumbValidator
+from home.src.download.yt_dlp_base import InfoCache
 from home.src.download.yt_dlp_handler import VideoDownloader
 from home.src.es.backup import ElasticBackup
+from home.src.es.connect import RefreshPolicy
 from home.src.es.index_setup import ElasitIndexWrap
 from home.src.index.channel import YoutubeChannel
 from home.src.index.filesystem import Scanner
@@ -110,9 +115,13 @@ class BaseTask(Task):
         },
     }
 
+    PROGRESS_INTERVAL = float(os.environ.get("TASK_PROGRESS_INTERVAL") or 1)
+    COMMAND_INTERVAL = 1
+
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         """callback for task failure"""
         print(f"{task_id} Failed callback")
+        self.flush_progress()
         message, key = self._build_message(level="error")
         message.update({"messages": [f"Task failed: {exc}"]})
         RedisArchivist().set_message(key, message, expire=20)
@@ -120,6 +129,7 @@ class BaseTask(Task):
     def on_success(self, retval, task_id, args, kwargs):
         """callback task completed successfully"""
         print(f"{task_id} success callback")
+        self.flush_progress()
         message, key = self._build_message()
         message.update({"messages": ["Task completed successfully"]})
         RedisArchivist().set_message(key, message, expire=5)
@@ -127,6 +137,7 @@ class BaseTask(Task):
     def before_start(self, task_id, args, kwargs):
         """callback before initiating task"""
         print(f"{self.name} create callback")
+        RefreshPolicy.start_background()
         message, key = self._build_message()
         message.update({"messages": ["New task received."]})
         RedisArchivist().set_message(key, message)
@@ -134,44 +145,104 @@ class BaseTask(Task):
     def after_return(self, status, retval, task_id, args, kwargs, einfo):
         """callback after task returns"""
         print(f"{task_id} return callback")
+        RefreshPolicy.finish_background()
         task_title = self.TASK_CONFIG.get(self.name).get("title")
         Notifications(self.name, task_id, task_title).send()
 
     def send_progress(self, message_lines, progress=False, title=False):
-        """send progress message"""
-        message, key = self._build_message()
-        message.update(
-            {
-                "messages": message_lines,
-                "progress": progress,
+        """send progress message, coalesced to PROGRESS_INTERVAL"""
+        state = self._get_progress_state()
+        with state["lock"]:
+            state["pending"] = (message_lines, progress, title)
+            wait = state["last_sent"] + self.PROGRESS_INTERVAL - time()
+            if wait > 0:
+                # publish latest state when interval has passed
+                if not state["timer"]:
+                    state["timer"] = threading.Timer(
+                        wait, self.flush_progress, args=(state,)
+                    )
+                    state["timer"].daemon = True
+                    state["timer"].start()
+                return
+
+        self.flush_progress(state)
+
+    def flush_progress(self, state=False):
+        """publish pending progress message now"""
+        state = state or self._get_progress_state()
+        with state["lock"]:
+            if state["timer"]:
+                state["timer"].cancel()
+                state["timer"] = False
+
+            if not state["pending"]:
+                return
+
+            message_lines, progress, title = state["pending"]
+            state["pending"] = False
+            state["last_sent"] = time()
+            message, key = self._build_message(task_id=state["task_id"])
+            message.update(
+                {
+                    "messages": message_lines,
+                    "progress": progress,
+                }
+            )
+            if title:
+                message["title"] = title
+
+            RedisArchivist().set_message(key, message)
+
+    def _get_progress_state(self):
+        """get progress state of current task"""
+        task_id = self.request.id
+        state = getattr(self, "_progress_state", False)
+        if not state or state["task_id"] != task_id:
+            state = {
+                "task_id": task_id,
+                "lock": threading.Lock(),
+                "pending": False,
+                "last_sent": 0,
+                "timer": False,
             }
-        )
-        if title:
-            message["title"] = title
+            self._progress_state = state
 
-        RedisArchivist().set_message(key, message)
+        return state
 
-    def _build_message(self, level="info"):
+    def _build_message(self, level="info", task_id=False):
         """build message dict"""
-        task_id = self.request.id
+        task_id = task_id or self.request.id
         message = self.TASK_CONFIG.get(self.name).copy()
         message.update({"level": level, "id": task_id})
-        task_result = TaskManager().get_task(task_id)
-        if task_result:
-            command = task_result.get("command", False)
+        command = self._get_command(task_id)
+        if command is not None:
             message.update({"command": command})
 
         key = f"message:{message.get('group')}:{task_id.split('-')[0]}"
         return message, key
 
+    def _get_command(self, task_id):
+        """get task command, cached for COMMAND_INTERVAL"""
+        cached = getattr(self, "_command_cache", False)
+        if cached and cached[0] == task_id:
+            if time() - cached[1] < self.COMMAND_INTERVAL:
+                return cached[2]
+
+        task_result = TaskManager().get_task(task_id)
+        command = task_result.get("command", False) if task_result else None
+        self._command_cache = (task_id, time(), command)
+
+        return command
+
     def is_stopped(self):
         """check if task is stopped"""
-        return TaskManager().is_stopped(self.request.id)
+        return self._get_command(self.request.id) == "STOP"
 
 
 @shared_task(name="update_subscribed", bind=True, base=BaseTask)
-def update_subscribed(self):
-    """look for missing videos and add to pending"""
+def update_subscribed(self, due_only=False):
+    """look for missing videos and add to pending,
+    due_only from scheduler to only scan channels due"""
     manager = TaskManager()
     if manager.is_pending(self):
         print(f"[task][{self.name}] rescan already running")
@@ -179,15 +250,18 @@ def update_subscribed(self):
         return None
 
     manager.init(self)
-    handler = SubscriptionScanner(task=self)
+    handler = SubscriptionScanner(task=self, due_only=due_only)
     missing_videos = handler.scan()
     auto_start = handler.auto_start
     if missing_videos:
         print(missing_videos)
-        extrac_dl.delay(missing_videos, auto_start=auto_start)
+        extrac_dl.delay(
+            missing_videos, auto_start=auto_start, markers=handler.markers
+        )
         message = f"Found {len(missing_videos)} videos to add to the queue."
         return message
 
+    ChannelSubscription.save_markers(handler.markers)
     return None
 
 
@@ -211,8 +285,9 @@ def download_pending(self, auto_only=False):
 
 
 @shared_task(name="extract_download", bind=True, base=BaseTask)
-def extrac_dl(self, youtube_ids, auto_start=False):
-    """parse list passed and add to pending"""
+def extrac_dl(self, youtube_ids, auto_start=False, markers=False):
+    """parse list passed and add to pending,
+    markers from subscription scan to store after adding"""
     TaskManager().init(self)
     if isinstance(youtube_ids, str):
         to_add = Parser(youtube_ids).parse()
@@ -222,8 +297,11 @@ def extrac_dl(self, youtube_ids, auto_start=False):
     pending_handler = PendingList(youtube_ids=to_add, task=self)
     pending_handler.parse_url_list()
     pending_handler.add_to_pending(auto_start=auto_start)
+    if markers:
+        ChannelSubscription.save_markers(markers)
 
     if auto_start:
+        RefreshPolicy.refresh_touched()
         download_pending.delay(auto_only=True)
 
 
@@ -318,7 +396,7 @@ def rescan_filesystem(self):
 
 @shared_task(bind=True, name="thumbnail_check", base=BaseTask)
 def thumbnail_check(self):
-    """validate thumbnails"""
+    """validate thumbnails, clean expired info json cache"""
     manager = TaskManager()
     if manager.is_pending(self):
         print(f"[task][{self.name}] thumbnail check is already running")
@@ -327,6 +405,8 @@ def thumbnail_check(self):
 
     manager.init(self)
     ThumbValidator(task=self).validate()
+    deleted = InfoCache.clean(AppConfig().config)
+    print(f"[task][{self.name}] deleted {deleted} expired info json files")
 
 
 @shared_task(bind=True, name="resync_thumbs", base=BaseTask)
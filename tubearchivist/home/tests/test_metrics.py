@@ -0,0 +1,40 @@
+"""test es metrics endpoint normalization"""
+
+from django.test import TestCase
+from home.src.es.metrics import ElasticMetrics
+
+
+class NormalizeTests(TestCase):
+    """normalize es paths to bounded endpoint names"""
+
+    def test_root(self):
+        """root path stays as is"""
+        self.assertEqual(ElasticMetrics.normalize("/"), "/")
+
+    def test_api_verb(self):
+        """keep api verbs, strip query string"""
+        path = "_reindex?refresh=true"
+        self.assertEqual(ElasticMetrics.normalize(path), "_reindex")
+
+    def test_index_search(self):
+        """replace index name"""
+        path = "ta_video/_search?filter_path=hits.total"
+        self.assertEqual(ElasticMetrics.normalize(path), "{index}/_search")
+
+    def test_doc_id(self):
+        """replace document id"""
+        path = "ta_video/_doc/dQw4w9WgXcQ"
+        expected = "{index}/_doc/{id}"
+        self.assertEqual(ElasticMetrics.normalize(path), expected)
+
+    def test_doc_id_underscore(self):
+        """replace document id starting with underscore"""
+        path = "ta_video/_update/_dQw4w9WgX"
+        expected = "{index}/_update/{id}"
+        self.assertEqual(ElasticMetrics.normalize(path), expected)
+
+    def test_api_resource(self):
+        """replace resource names of api calls"""
+        path = "_snapshot/ta_snapshot/ta_daily_-abc/_restore"
+        expected = "_snapshot/{id}/{id}/_restore"
+        self.assertEqual(ElasticMetrics.normalize(path), expected)
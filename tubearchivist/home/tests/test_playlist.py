@@ -0,0 +1,124 @@
+"""test playlist entries sync to video positions"""
+
+from unittest.mock import patch
+
+from django.test import TestCase
+from home.src.index.generic import YouTubeItem
+from home.src.index.playlist import PlaylistEntries, YoutubePlaylist
+
+
+class FakeBulk:
+    """record bulk actions instead of sending to es"""
+
+    added: list = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add(self, action, source=None):
+        """record action"""
+        self.added.append((action, source))
+
+
+def build_entry(youtube_id, idx):
+    """build downloaded playlist entry"""
+    return {
+        "youtube_id": youtube_id,
+        "title": f"title {youtube_id}",
+        "uploader": "uploader",
+        "idx": idx,
+        "downloaded": True,
+    }
+
+
+def build_hit(entry):
+    """build indexed hit of playlist entry"""
+    return {"_id": f"PL123-{entry['idx']}", "_source": entry}
+
+
+def sync(indexed, all_members):
+    """write all_members over indexed entries, return playlist"""
+    FakeBulk.added = []
+    with (
+        patch.object(PlaylistEntries, "_search") as search,
+        patch("home.src.index.playlist.BulkWriter", FakeBulk),
+        patch.object(YouTubeItem, "upload_to_es"),
+    ):
+        search.return_value = [build_hit(i) for i in indexed]
+        playlist = YoutubePlaylist("PL123")
+        playlist.all_members = all_members
+        playlist.upload_to_es()
+        playlist.add_vids_to_playlist(playlist.get_changed_downloaded())
+
+    return playlist
+
+
+def get_added(index_name):
+    """recorded bulk sources by doc id of index"""
+    return {
+        action["update"]["_id"]: source
+        for action, source in FakeBulk.added
+        if "update" in action and action["update"]["_index"] == index_name
+    }
+
+
+class PlaylistPositionTests(TestCase):
+    """positions of videos follow reordered playlist entries"""
+
+    def test_reorder_updates_video_positions(self):
+        """moved entries update playlist_position idx of videos"""
+        indexed = [build_entry(i, idx) for idx, i in enumerate("abc")]
+        reordered = [build_entry(i, idx) for idx, i in enumerate("cab")]
+        sync(indexed, reordered)
+
+        positions = {
+            video_id: source["script"]["params"]["idx"]
+            for video_id, source in get_added("ta_video").items()
+        }
+        self.assertEqual(positions, {"a": 1, "b": 2, "c": 0})
+
+        entries = {
+            entry_id: source["doc"]["youtube_id"]
+            for entry_id, source in get_added("ta_playlist_entry").items()
+        }
+        self.assertEqual(
+            entries, {"PL123-0": "c", "PL123-1": "a", "PL123-2": "b"}
+        )
+
+    def test_duplicate_video_keeps_all_entries(self):
+        """video added twice is stored at both positions"""
+        all_members = [build_entry(i, idx) for idx, i in enumerate("aba")]
+        sync([], all_members)
+
+        entries = {
+            entry_id: source["doc"]["youtube_id"]
+            for entry_id, source in get_added("ta_playlist_entry").items()
+        }
+        self.assertEqual(
+            entries, {"PL123-0": "a", "PL123-1": "b", "PL123-2": "a"}
+        )
+
+        positions = {
+            video_id: source["script"]["params"]["idx"]
+            for video_id, source in get_added("ta_video").items()
+        }
+        self.assertEqual(positions, {"a": 0, "b": 1})
+
+    def test_removed_entry_deleted_by_position(self):
+        """shorter playlist deletes entries at trailing positions"""
+        indexed = [build_entry(i, idx) for idx, i in enumerate("abc")]
+        sync(indexed, indexed[:2])
+
+        deleted = [
+            action["delete"]["_id"]
+            for action, _ in FakeBulk.added
+            if "delete" in action
+        ]
+        self.assertEqual(deleted, ["PL123-2"])
+        self.assertFalse(get_added("ta_playlist_entry"))
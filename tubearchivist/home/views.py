@@ -12,13 +12,13 @@ from api.src.search_processor import SearchProcess
 from django.conf import settings
 from django.contrib.auth import login
 from django.contrib.auth.forms import AuthenticationForm
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.shortcuts import redirect, render
 from django.views import View
 from home.src.download.queue import PendingInteract
 from home.src.download.yt_dlp_base import CookieHandler
 from home.src.es.backup import ElasticBackup
-from home.src.es.connect import ElasticWrap
+from home.src.es.connect import ElasticWrap, MultiSearch
 from home.src.es.snapshot import ElasticSnapshot
 from home.src.frontend.api_calls import PostData
 from home.src.frontend.forms import (
@@ -35,7 +35,7 @@ from home.src.frontend.forms import (
 from home.src.frontend.searching import SearchHandler
 from home.src.index.channel import channel_overwrites
 from home.src.index.generic import Pagination
-from home.src.index.playlist import YoutubePlaylist
+from home.src.index.playlist import PlaylistEntries, YoutubePlaylist
 from home.src.index.reindex import ReindexProgress
 from home.src.index.video_constants import VideoTypeEnum
 from home.src.ta.config import AppConfig, ReleaseVersion, ScheduleBuilder
@@ -458,25 +458,33 @@ class DownloadView(ArchivistResultsView):
 class ChannelIdBaseView(ArchivistResultsView):
     """base class for all channel-id views"""
 
-    def get_channel_meta(self, channel_id):
-        """get metadata for channel"""
-        path = f"ta_channel/_doc/{channel_id}"
-        response, _ = ElasticWrap(path).get()
-        channel_info = SearchProcess(response).process()
+    def channel_pages(self, channel_id):
+        """get additional context and channel hit in one round trip"""
+        search = MultiSearch(config=self.default_conf)
+        search.add("ta_download", self.get_pending_data(channel_id))
+        search.add("ta_video", self.get_type_data("streams", channel_id))
+        search.add("ta_video", self.get_type_data("shorts", channel_id))
+        search.add("ta_playlist", self.get_playlist_data(channel_id))
+        search.add("ta_channel", {"query": {"ids": {"values": [channel_id]}}})
+        pending, streams, shorts, playlists, channel = search.run()
 
-        return channel_info
+        self.context.update(
+            {
+                "has_pending": bool(pending["hits"]["hits"]),
+                "has_streams": bool(streams["hits"]["hits"]),
+                "has_shorts": bool(shorts["hits"]["hits"]),
+                "has_playlists": bool(playlists["hits"]["hits"]),
+            }
+        )
+        if not channel["hits"]["hits"]:
+            raise Http404
 
-    def channel_pages(self, channel_id):
-        """get additional context for channel pages"""
-        self.channel_has_pending(channel_id)
-        self.channel_has_streams(channel_id)
-        self.channel_has_shorts(channel_id)
-        self.channel_has_playlist(channel_id)
-
-    def channel_has_pending(self, channel_id):
-        """check if channel has pending videos in queue"""
-        path = "ta_download/_search"
-        data = {
+        return channel["hits"]["hits"][0]
+
+    @staticmethod
+    def get_pending_data(channel_id):
+        """build data query for pending videos of channel"""
+        return {
             "size": 1,
             "query": {
                 "bool": {
@@ -488,23 +496,6 @@ class ChannelIdBaseView(ArchivistResultsView):
             },
             "_source": False,
         }
-        response, _ = ElasticWrap(path).get(data=data)
-
-        self.context.update({"has_pending": bool(response["hits"]["hits"])})
-
-    def channel_has_streams(self, channel_id):
-        """check if channel has streams videos"""
-        data = self.get_type_data("streams", channel_id)
-        response, _ = ElasticWrap("ta_video/_search").get(data=data)
-
-        self.context.update({"has_streams": bool(response["hits"]["hits"])})
-
-    def channel_has_shorts(self, channel_id):
-        """check if channel has shorts videos"""
-        data = self.get_type_data("shorts", channel_id)
-        response, _ = ElasticWrap("ta_video/_search").get(data=data)
-
-        self.context.update({"has_shorts": bool(response["hits"]["hits"])})
 
     @staticmethod
     def get_type_data(vid_type, channel):
@@ -522,16 +513,14 @@ class ChannelIdBaseView(ArchivistResultsView):
             "_source": False,
         }
 
-    def channel_has_playlist(self, channel_id):
-        """check if channel has any playlist indexed"""
-        path = "ta_playlist/_search"
-        data = {
+    @staticmethod
+    def get_playlist_data(channel_id):
+        """build data query for playlists of channel"""
+        return {
             "size": 1,
             "query": {"term": {"playlist_channel_id": {"value": channel_id}}},
             "_source": False,
         }
-        response, _ = ElasticWrap(path).get(data=data)
-        self.context.update({"has_playlists": bool(response["hits"]["hits"])})
 
 
 class ChannelIdView(ChannelIdBaseView):
@@ -549,15 +538,14 @@ class ChannelIdView(ChannelIdBaseView):
         self._update_view_data(channel_id)
         self.find_results()
         self.match_progress()
-        self.channel_pages(channel_id)
+        channel_hit = self.channel_pages(channel_id)
 
         if self.context["results"]:
             channel_info = self.context["results"][0]["source"]["channel"]
             channel_name = channel_info["channel_name"]
         else:
             # fall back channel lookup if no videos found
-            es_path = f"ta_channel/_doc/{channel_id}"
-            channel_info = self.single_lookup(es_path)
+            channel_info = SearchHandler.hit_cleanup(channel_hit)["source"]
             channel_name = channel_info["channel_name"]
 
         self.context.update(
@@ -626,10 +614,8 @@ class ChannelIdAboutView(ChannelIdBaseView):
     def get(self, request, channel_id):
         """handle get request"""
         self.initiate_vars(request)
-        self.channel_pages(channel_id)
-
-        response, _ = ElasticWrap(f"ta_channel/_doc/{channel_id}").get()
-        channel_info = SearchProcess(response).process()
+        channel_hit = self.channel_pages(channel_id)
+        channel_info = SearchProcess(channel_hit).process()
         reindex = ReindexProgress(
             request_type="channel", request_id=channel_id
         ).get_progress()
@@ -674,9 +660,8 @@ class ChannelIdPlaylistView(ChannelIdBaseView):
         self.initiate_vars(request)
         self._update_view_data(channel_id)
         self.find_results()
-        self.channel_pages(channel_id)
-
-        channel_info = self.get_channel_meta(channel_id)
+        channel_hit = self.channel_pages(channel_id)
+        channel_info = SearchProcess(channel_hit).process()
         channel_name = channel_info["channel_name"]
         self.context.update(
             {
@@ -753,9 +738,9 @@ class PlaylistIdView(ArchivistResultsView):
     def get(self, request, playlist_id):
         """handle get request"""
         self.initiate_vars(request)
-        playlist_info, channel_info = self._get_info(playlist_id)
+        playlist_info, channel_info, total = self._get_info(playlist_id)
         playlist_name = playlist_info["playlist_name"]
-        self._update_view_data(playlist_id, playlist_info)
+        self._update_view_data(playlist_id)
         self.find_results()
         self.match_progress()
         reindex = ReindexProgress(
@@ -767,6 +752,7 @@ class PlaylistIdView(ArchivistResultsView):
                 "title": "Playlist: " + playlist_name,
                 "playlist_info": playlist_info,
                 "playlist_name": playlist_name,
+                "playlist_total": total,
                 "channel_info": channel_info,
                 "reindex": reindex.get("state"),
             }
@@ -774,29 +760,41 @@ class PlaylistIdView(ArchivistResultsView):
         return render(request, "home/playlist_id.html", self.context)
 
     def _get_info(self, playlist_id):
-        """return additional metadata"""
-        # playlist details
-        es_path = f"ta_playlist/_doc/{playlist_id}"
-        playlist_info = self.single_lookup(es_path)
+        """return playlist, channel metadata and total entries
+        in one round trip"""
+        playlist_data = {"query": {"ids": {"values": [playlist_id]}}}
+        channel_lookup = {
+            "index": "ta_playlist",
+            "id": playlist_id,
+            "path": "playlist_channel_id",
+        }
+        channel_data = {"query": {"terms": {"channel_id": channel_lookup}}}
+        entries = PlaylistEntries(playlist_id)
+        entry_data = {
+            "query": entries.get_query(),
+            "size": 0,
+            "track_total_hits": True,
+        }
+        search = MultiSearch(config=self.default_conf)
+        search.add("ta_playlist", playlist_data)
+        search.add("ta_channel", channel_data)
+        search.add(entries.INDEX, entry_data)
+        playlist, channel, entry = search.run()
+        if not playlist["hits"]["hits"] or not channel["hits"]["hits"]:
+            raise Http404
+
+        playlist_hit = SearchHandler.hit_cleanup(playlist["hits"]["hits"][0])
+        channel_hit = SearchHandler.hit_cleanup(channel["hits"]["hits"][0])
 
-        # channel details
-        channel_id = playlist_info["playlist_channel_id"]
-        es_path = f"ta_channel/_doc/{channel_id}"
-        channel_info = self.single_lookup(es_path)
+        total = entry["hits"]["total"]["value"]
 
-        return playlist_info, channel_info
+        return playlist_hit["source"], channel_hit["source"], total
 
-    def _update_view_data(self, playlist_id, playlist_info):
+    def _update_view_data(self, playlist_id):
         """update view specific data dict"""
-        sort = {
-            i["youtube_id"]: i["idx"]
-            for i in playlist_info["playlist_entries"]
+        position_filter = {
+            "term": {"playlist_position.playlist_id": {"value": playlist_id}}
         }
-        script = (
-            "if(params.scores.containsKey(doc['youtube_id'].value)) "
-            + "{return params.scores[doc['youtube_id'].value];} "
-            + "return 100000;"
-        )
         self.data.update(
             {
                 "query": {
@@ -806,14 +804,12 @@ class PlaylistIdView(ArchivistResultsView):
                 },
                 "sort": [
                     {
-                        "_script": {
-                            "type": "number",
-                            "script": {
-                                "lang": "painless",
-                                "source": script,
-                                "params": {"scores": sort},
-                            },
+                        "playlist_position.idx": {
                             "order": "asc",
+                            "nested": {
+                                "path": "playlist_position",
+                                "filter": position_filter,
+                            },
                         }
                     }
                 ],